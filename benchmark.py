@@ -0,0 +1,224 @@
+import io
+import sys
+import time
+
+import fastavro
+
+import combine_shards
+import records as records_lib
+import render_flat
+import request_source
+import write_main_index
+
+USAGE_STR = 'python benchmark.py [records|codecs] [count]'
+MIN_ARGS = 1
+MAX_ARGS = 2
+DEFAULT_COUNT = 100000
+BATCH_SIZE = 1000
+SPECIES_PER_HAUL = 100
+KEYS_PER_VALUE = 20
+
+SAMPLE_VALUES = {
+    'int': lambda i: 2000 + i % 40,
+    'long': lambda i: i,
+    'float': lambda i: i * 0.5,
+    'double': lambda i: i * 0.25,
+    'string': lambda i: 'value_%d' % (i % 500),
+    'boolean': lambda i: i % 2 == 0
+}
+
+
+def get_primitive_type(field):
+    field_type = field['type']
+    if isinstance(field_type, list):
+        return next(filter(lambda x: x != 'null', field_type))
+    else:
+        return field_type
+
+
+def make_sample_records(schema, count, get_seed=None):
+    if get_seed is None:
+        get_seed = lambda name, i: i
+
+    fields = list(map(
+        lambda x: (x['name'], SAMPLE_VALUES[get_primitive_type(x)]),
+        schema['fields']
+    ))
+    return [
+        dict(map(lambda x: (x[0], x[1](get_seed(x[0], i))), fields))
+        for i in range(count)
+    ]
+
+
+def make_observation_records(count):
+    haul_fields = set(map(
+        lambda x: x['name'],
+        request_source.HAUL_SCHEMA['fields']
+    ))
+
+    def get_seed(name, i):
+        if name in haul_fields:
+            return i // SPECIES_PER_HAUL
+        else:
+            return i % SPECIES_PER_HAUL
+
+    return make_sample_records(
+        render_flat.OBSERVATION_SCHEMA,
+        count,
+        get_seed=get_seed
+    )
+
+
+def make_index_records(count):
+    key_schema = write_main_index.KEY_SCHEMA
+    keys = make_sample_records(key_schema, count * KEYS_PER_VALUE)
+    return [
+        {
+            'value': 'value_%d' % i,
+            'keys': keys[i * KEYS_PER_VALUE:(i + 1) * KEYS_PER_VALUE]
+        }
+        for i in range(count)
+    ]
+
+
+def time_batches(records, write_batch):
+    batches = [
+        records[i:i + BATCH_SIZE]
+        for i in range(0, len(records), BATCH_SIZE)
+    ]
+    start = time.perf_counter()
+    for batch in batches:
+        write_batch(batch)
+    return len(records) / (time.perf_counter() - start)
+
+
+def run_records(count):
+    observation_schema = render_flat.OBSERVATION_SCHEMA
+    catch_schema = request_source.CATCH_SCHEMA
+
+    def legacy_observation(batch):
+        def complete_record(target):
+            keys = map(lambda x: x['name'], observation_schema['fields'])
+            keys_realized = list(keys)
+            values = map(lambda x: target.get(x, None), keys_realized)
+            return dict(zip(keys_realized, values))
+
+        target_buffer = io.BytesIO()
+        records_complete = map(complete_record, batch)
+        fastavro.writer(target_buffer, observation_schema, records_complete)
+
+    def compiled_observation(batch):
+        target_buffer = io.BytesIO()
+        compiled = records_lib.compile_schema(observation_schema)
+        compiled.write_projected(target_buffer, batch)
+
+    def legacy_catch(batch):
+        fastavro.writer(io.BytesIO(), catch_schema, batch)
+
+    def compiled_catch(batch):
+        compiled = records_lib.compile_schema(catch_schema)
+        compiled.write(io.BytesIO(), batch)
+
+    observation_records = make_sample_records(observation_schema, count)
+    catch_records = make_sample_records(catch_schema, count)
+
+    benchmarks = [
+        ('observation', 'legacy', legacy_observation, observation_records),
+        ('observation', 'compiled', compiled_observation, observation_records),
+        ('catch', 'legacy', legacy_catch, catch_records),
+        ('catch', 'compiled', compiled_catch, catch_records)
+    ]
+
+    print('artifact\tpath\trecords_per_second')
+    for artifact, path, write_batch, records in benchmarks:
+        records_per_second = time_batches(records, write_batch)
+        print('%s\t%s\t%.0f' % (artifact, path, records_per_second))
+
+
+def time_codec(schema, records, codec):
+    compiled = records_lib.compile_schema(schema)
+
+    target_buffer = io.BytesIO()
+    start = time.perf_counter()
+    compiled.write(target_buffer, records, codec=codec)
+    encode_duration = time.perf_counter() - start
+
+    num_bytes = target_buffer.tell()
+    target_buffer.seek(0)
+    start = time.perf_counter()
+    num_read = sum(map(lambda x: 1, fastavro.reader(target_buffer)))
+    decode_duration = time.perf_counter() - start
+
+    return {
+        'encode': len(records) / encode_duration,
+        'decode': num_read / decode_duration,
+        'bytes': num_bytes
+    }
+
+
+def run_codecs(count):
+    artifacts = [
+        ('haul', request_source.HAUL_SCHEMA, make_sample_records(
+            request_source.HAUL_SCHEMA,
+            count
+        )),
+        ('catch', request_source.CATCH_SCHEMA, make_sample_records(
+            request_source.CATCH_SCHEMA,
+            count
+        )),
+        ('species', request_source.SPECIES_SCHEMA, make_sample_records(
+            request_source.SPECIES_SCHEMA,
+            count
+        )),
+        ('joined', render_flat.OBSERVATION_SCHEMA, make_observation_records(
+            count
+        )),
+        ('index', combine_shards.INDEX_SCHEMA, make_index_records(
+            count // KEYS_PER_VALUE
+        )),
+        ('main_index', write_main_index.KEY_SCHEMA, make_sample_records(
+            write_main_index.KEY_SCHEMA,
+            count
+        ))
+    ]
+    codecs = records_lib.get_available_codecs()
+
+    print('artifact\tcodec\tencode_rps\tdecode_rps\tbytes\tratio')
+    for artifact, schema, records in artifacts:
+        results = dict(map(
+            lambda x: (x, time_codec(schema, records, x)),
+            codecs
+        ))
+        null_bytes = results['null']['bytes']
+        for codec in codecs:
+            result = results[codec]
+            template_vals = (
+                artifact,
+                codec,
+                result['encode'],
+                result['decode'],
+                result['bytes'],
+                null_bytes / max(result['bytes'], 1)
+            )
+            print('%s\t%s\t%.0f\t%.0f\t%d\t%.2f' % template_vals)
+
+
+def main():
+    if len(sys.argv) < MIN_ARGS + 1 or len(sys.argv) > MAX_ARGS + 1:
+        print(USAGE_STR)
+        sys.exit(1)
+
+    command = sys.argv[1]
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_COUNT
+
+    if command == 'records':
+        run_records(count)
+    elif command == 'codecs':
+        run_codecs(count)
+    else:
+        print(USAGE_STR)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
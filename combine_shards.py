@@ -1,12 +1,16 @@
-import io
 import itertools
 import os
 import sys
 
-import boto3
 import fastavro
 import toolz.itertoolz
 
+import index_sidecars
+import postings
+import records as records_lib
+import render_flat
+import storage as storage_lib
+
 REQUIRES_ROUNDING = {
     'latitude_dd_start',
     'longitude_dd_start',
@@ -49,6 +53,10 @@ INDEX_SCHEMA = {
 
 REQUIRES_DATE_ROUND = {'date_time'}
 
+NUMERIC_KEYS = REQUIRES_ROUNDING | index_sidecars.get_numeric_keys(
+    render_flat.OBSERVATION_SCHEMA
+)
+
 NUM_ARGS = 2
 USAGE_STR = 'python combine_shards.py [bucket] [key]'
 
@@ -66,20 +74,10 @@ def main():
     with open(loc) as f:
         batches = [int(x.strip()) for x in f]
 
-    access_key = os.environ['AWS_ACCESS_KEY']
-    access_secret = os.environ['AWS_ACCESS_SECRET']
+    storage = storage_lib.get_storage(bucket)
 
-    s3_client = boto3.client(
-        's3',
-        aws_access_key_id=access_key,
-        aws_secret_access_key=access_secret
-    )
-
-    def get_avro(full_loc):
-        target_buffer = io.BytesIO()
-        s3_client.download_fileobj(bucket, full_loc, target_buffer)
-        target_buffer.seek(0)
-        return list(fastavro.reader(target_buffer))
+    def get_reader(full_loc):
+        return fastavro.reader(storage.get(full_loc))
 
     def normalize_record(target):
         value = target['value']
@@ -92,25 +90,50 @@ def main():
         return target
 
     batch_locs = map(lambda x: 'index_sharded/%s_%d.avro' % (key, x), batches)
-    shards = map(get_avro, batch_locs)
+    shards = list(map(get_reader, batch_locs))
+
+    compact_flags = set(map(postings.is_compact, shards))
+    if len(compact_flags) > 1:
+        print('Shards for %s mix index formats.' % key)
+        sys.exit(1)
+
+    if compact_flags == {True}:
+        fingerprints = set(map(
+            lambda x: postings.get_main_fingerprint(x.metadata),
+            shards
+        ))
+        if len(fingerprints) > 1 or None in fingerprints:
+            print('Shards for %s disagree on the main index.' % key)
+            sys.exit(1)
+
+        schema = postings.COMPACT_INDEX_SCHEMA
+        metadata = postings.make_compact_metadata(fingerprints.pop())
+    else:
+        schema = INDEX_SCHEMA
+        metadata = None
+
     combined = itertools.chain(*shards)
-    normalized = map(normalize_record, combined)
-
-    write_buffer = io.BytesIO()
-    fastavro.writer(
-        write_buffer,
-        INDEX_SCHEMA,
-        normalized
-    )
-    write_buffer.seek(0)
-
-    s3_client = boto3.client(
-        's3',
-        aws_access_key_id=access_key,
-        aws_secret_access_key=access_secret
-    )
-    output_loc = 'index/%s.avro' % key
-    s3_client.upload_fileobj(write_buffer, bucket, output_loc)
+    normalized = list(map(normalize_record, combined))
+    compiled_schema = records_lib.compile_schema(schema)
+    output_loc = index_sidecars.get_index_loc(key)
+
+    if key in NUMERIC_KEYS:
+        blocked = index_sidecars.write_blocked(
+            compiled_schema,
+            index_sidecars.sort_numeric(normalized),
+            metadata=metadata
+        )
+        storage.put(output_loc, blocked['buffer'])
+        index_sidecars.write_blocks(storage, key, blocked)
+    else:
+        blocked = index_sidecars.write_blocked(
+            compiled_schema,
+            index_sidecars.sort_values(normalized),
+            metadata=metadata
+        )
+        storage.put(output_loc, blocked['buffer'])
+        index_sidecars.write_dictionary(storage, key, blocked)
+        index_sidecars.write_bloom(storage, key, blocked)
 
 
 if __name__ == '__main__':
@@ -42,8 +42,6 @@ echo "net_width_m"
 python combine_shards.py $BUCKET_NAME net_width_m
 echo "performance"
 python combine_shards.py $BUCKET_NAME performance
-echo "requirements"
-python combine_shards.py $BUCKET_NAME requirements
 echo "scientific_name"
 python combine_shards.py $BUCKET_NAME scientific_name
 echo "species_code"
@@ -64,8 +62,6 @@ echo "survey_name"
 python combine_shards.py $BUCKET_NAME survey_name
 echo "taxon_confidence"
 python combine_shards.py $BUCKET_NAME taxon_confidence
-echo "variables"
-python combine_shards.py $BUCKET_NAME variables
 echo "vessel_id"
 python combine_shards.py $BUCKET_NAME vessel_id
 echo "vessel_name"
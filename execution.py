@@ -0,0 +1,58 @@
+import os
+
+import distributed
+
+ENGINES = {'coiled', 'local'}
+DEFAULT_ENGINE = 'coiled'
+SHARED_MODULES = ['storage.py', 'joined.py', 'records.py', 'postings.py']
+CLUSTER_NAME = 'DseProcessAfscgap'
+VM_TYPES = ['m7a.medium']
+
+
+def start_cluster(engine, n_workers, environ, adapt_maximum=None):
+    if engine not in ENGINES:
+        raise ValueError('Unknown engine: %s' % engine)
+
+    if engine == 'coiled':
+        import coiled
+
+        cluster = coiled.Cluster(
+            name=CLUSTER_NAME,
+            n_workers=n_workers,
+            worker_vm_types=VM_TYPES,
+            scheduler_vm_types=VM_TYPES,
+            environ=environ
+        )
+
+        if adapt_maximum is not None:
+            cluster.adapt(minimum=n_workers, maximum=adapt_maximum)
+
+        client = cluster.get_client()
+        for module in SHARED_MODULES:
+            client.upload_file(module)
+    else:
+        cluster = distributed.LocalCluster(
+            n_workers=n_workers,
+            threads_per_worker=1,
+            processes=True
+        )
+        client = distributed.Client(cluster)
+
+    return {'engine': engine, 'cluster': cluster, 'client': client}
+
+
+def stop_cluster(execution):
+    if execution['engine'] == 'coiled':
+        execution['cluster'].close(force_shutdown=True)
+    else:
+        execution['client'].close()
+        execution['cluster'].close()
+
+
+def get_n_workers(options, engine, coiled_default):
+    if 'workers' in options:
+        return int(options['workers'])
+    elif engine == 'coiled':
+        return coiled_default
+    else:
+        return os.cpu_count()
@@ -0,0 +1,248 @@
+import codecs
+import email.utils
+import json
+import random
+import re
+import threading
+import time
+
+import requests
+import requests.adapters
+
+DEFAULT_DOMAIN = 'https://apps-st.fisheries.noaa.gov'
+RETRY_STATUS_CODES = {408, 425, 429, 500, 502, 503, 504}
+DEFAULT_MAX_RETRIES = 8
+DEFAULT_BASE_DELAY = 0.5
+DEFAULT_MAX_DELAY = 60
+DEFAULT_MIN_PAGE_SIZE = 500
+DEFAULT_MAX_PAGE_SIZE = 10000
+DEFAULT_TARGET_LATENCY = 10
+PAGE_SIZE_STEP = 1000
+DEFAULT_POOL_SIZE = 16
+DEFAULT_TIMEOUT = (10, 120)
+CHUNK_SIZE = 64 * 1024
+
+ITEMS_START = re.compile(r'"items"\s*:\s*\[')
+HAS_MORE = re.compile(r'"hasMore"\s*:\s*(true|false)')
+WHITESPACE = re.compile(r'[\s,]*')
+
+
+class FossRequestError(Exception):
+    pass
+
+
+class IncompleteResponseError(Exception):
+    pass
+
+
+def iter_chunks_text(chunks):
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    for chunk in chunks:
+        yield decoder.decode(chunk)
+
+    yield decoder.decode(b'', final=True)
+
+
+def iter_items(chunks, tail):
+    decoder = json.JSONDecoder()
+    chunks_text = iter_chunks_text(chunks)
+    buffer = ''
+    match = None
+
+    for chunk in chunks_text:
+        buffer += chunk
+        match = ITEMS_START.search(buffer)
+        if match:
+            break
+
+    if match is None:
+        raise IncompleteResponseError('Response has no items array.')
+
+    pos = match.end()
+    items_done = False
+
+    while not items_done:
+        pos = WHITESPACE.match(buffer, pos).end()
+
+        if pos < len(buffer) and buffer[pos] == ']':
+            items_done = True
+            pos += 1
+            continue
+
+        try:
+            item, pos = decoder.raw_decode(buffer, pos)
+            yield item
+            continue
+        except json.JSONDecodeError:
+            pass
+
+        chunk = next(chunks_text, None)
+        if chunk is None:
+            raise IncompleteResponseError('Response ended inside items.')
+
+        buffer = buffer[pos:] + chunk
+        pos = 0
+
+    tail.append(buffer[pos:])
+    tail.extend(chunks_text)
+
+
+class PageSizer:
+
+    def __init__(self, initial_size=DEFAULT_MAX_PAGE_SIZE,
+        min_size=DEFAULT_MIN_PAGE_SIZE, max_size=DEFAULT_MAX_PAGE_SIZE,
+        target_latency=DEFAULT_TARGET_LATENCY):
+        self._min_size = min(min_size, max_size)
+        self._max_size = max_size
+        self._size = self._clamp(initial_size)
+        self._target_latency = target_latency
+        self._lock = threading.Lock()
+
+    def get_size(self):
+        with self._lock:
+            return self._size
+
+    def record_success(self, latency):
+        with self._lock:
+            if latency > self._target_latency * 1.5:
+                new_size = int(self._size * 0.75)
+            elif latency < self._target_latency:
+                new_size = self._size + PAGE_SIZE_STEP
+            else:
+                new_size = self._size
+
+            self._size = self._clamp(new_size)
+
+    def record_failure(self):
+        with self._lock:
+            self._size = self._clamp(self._size // 2)
+
+    def _clamp(self, size):
+        return max(self._min_size, min(self._max_size, size))
+
+
+class FossClient:
+
+    def __init__(self, domain=DEFAULT_DOMAIN, page_sizer=None,
+        max_retries=DEFAULT_MAX_RETRIES, base_delay=DEFAULT_BASE_DELAY,
+        max_delay=DEFAULT_MAX_DELAY, pool_size=DEFAULT_POOL_SIZE):
+        self._domain = domain
+        self._page_sizer = PageSizer() if page_sizer is None else page_sizer
+        self._max_retries = max_retries
+        self._base_delay = base_delay
+        self._max_delay = max_delay
+        self._session = requests.Session()
+        self._session.headers['Accept-Encoding'] = 'gzip, deflate'
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=pool_size
+        )
+        self._session.mount('https://', adapter)
+        self._session.mount('http://', adapter)
+
+    def get_page_size(self):
+        return self._page_sizer.get_size()
+
+    def get_page(self, endpoint, offset, limit, query=None, consume=list):
+        params = {'offset': offset, 'limit': limit}
+        if query is not None:
+            params['q'] = json.dumps(query, separators=(',', ':'))
+
+        full_url = self._domain + endpoint
+        attempt = 0
+
+        while True:
+            start = time.monotonic()
+
+            try:
+                response = self._session.get(
+                    full_url,
+                    params=params,
+                    stream=True,
+                    timeout=DEFAULT_TIMEOUT
+                )
+                with response:
+                    status_code = response.status_code
+                    if status_code == 200:
+                        page = self._consume_page(response, consume)
+            except (requests.RequestException, IncompleteResponseError):
+                response = None
+                status_code = None
+
+            if status_code == 200:
+                self._page_sizer.record_success(time.monotonic() - start)
+                self._check_complete(page, offset, limit)
+                return page
+
+            retryable = status_code is None
+            retryable = retryable or status_code in RETRY_STATUS_CODES
+            if not retryable or attempt >= self._max_retries:
+                template_vals = (offset, status_code, attempt + 1)
+                message = 'Offset of %d failed with status %s after %d tries.'
+                raise FossRequestError(message % template_vals)
+
+            self._page_sizer.record_failure()
+            delay = self._get_delay(attempt, response)
+            template_vals = (offset, status_code, delay)
+            message = 'Offset of %d with status %s. Waiting %.1fs...'
+            print(message % template_vals)
+            time.sleep(delay)
+            attempt += 1
+
+    def _consume_page(self, response, consume):
+        count = 0
+        tail = []
+
+        def count_items(items):
+            nonlocal count
+            for item in items:
+                count += 1
+                yield item
+
+        chunks = response.iter_content(chunk_size=CHUNK_SIZE)
+        items = count_items(iter_items(chunks, tail))
+        result = consume(items)
+
+        for remaining in items:
+            pass
+
+        has_more_match = HAS_MORE.search(''.join(tail))
+        if has_more_match:
+            has_more = has_more_match.group(1) == 'true'
+        else:
+            has_more = False
+
+        return {'items': result, 'count': count, 'hasMore': has_more}
+
+    def _get_delay(self, attempt, response):
+        retry_after = self._get_retry_after(response)
+        if retry_after is not None:
+            return min(retry_after, self._max_delay)
+
+        ceiling = min(self._max_delay, self._base_delay * 2 ** attempt)
+        return random.uniform(0, ceiling)
+
+    def _get_retry_after(self, response):
+        if response is None:
+            return None
+
+        value = response.headers.get('Retry-After', None)
+        if value is None:
+            return None
+
+        if value.strip().isdigit():
+            return float(value)
+
+        try:
+            retry_time = email.utils.parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+
+        return max(0, retry_time.timestamp() - time.time())
+
+    def _check_complete(self, page, offset, limit):
+        short = page['count'] < limit
+        if short and page['hasMore']:
+            template_vals = (offset, limit)
+            message = 'Offset of %d returned under %d rows with more left.'
+            raise FossRequestError(message % template_vals)
@@ -1,16 +1,26 @@
-import io
-import itertools
+import functools
 import os
 import sys
 
-import boto3
-import coiled
 import dask
 import dask.bag
-import fastavro
 
-USAGE_STR = 'python render_flat.py [bucket] [keys]'
+import execution as execution_lib
+import joined
+import postings
+import records as records_lib
+import storage as storage_lib
+
+USAGE_STR = (
+    'python generate_indicies.py [bucket] [keys] [--batch-size=n] '
+    '[--packed] [--haul-ids] [--columnar] [--engine=coiled|local] '
+    '[--workers=n]'
+)
 NUM_ARGS = 2
+DEFAULT_BATCH_SIZE = 50
+DEFAULT_COILED_WORKERS = 100
+NULL_GROUP = '\x00'
+NON_ZERO_FIELDS = ['cpue_kgkm2', 'cpue_nokm2', 'weight_kg', 'count']
 
 REQUIRES_ROUNDING = {
     'latitude_dd_start',
@@ -48,66 +58,167 @@ IGNORE_ZEROS = {
 
 
 
-def process_file(bucket, year, survey, haul, key):
+def process_file(bucket, year, survey, haul, keys, species_by_code,
+    packed=False, haul_ids=None, columnar=False):
 
-    import io
-    import os
-
-    import botocore
-    import boto3
-    import fastavro
-
-    access_key = os.environ['AWS_ACCESS_KEY']
-    access_secret = os.environ['AWS_ACCESS_SECRET']
+    import joined
+    import storage as storage_lib
 
-    s3_client = boto3.client(
-        's3',
-        aws_access_key_id=access_key,
-        aws_secret_access_key=access_secret
-    )
+    storage = storage_lib.get_storage(bucket)
 
     def get_avro(full_loc):
-        target_buffer = io.BytesIO()
         try:
-            s3_client.download_fileobj(bucket, full_loc, target_buffer)
-            target_buffer.seek(0)
-            return list(fastavro.reader(target_buffer))
-        except botocore.exceptions.ClientError:
+            source_buffer = storage.get(full_loc)
+            return list(joined.read_joined(source_buffer, species_by_code))
+        except storage_lib.MissingObjectError:
             return None
 
-    def generate_index_record(record):
+    def generate_index_record(record, key):
         value = record[key]
-        key_pieces = [year, survey, haul]
-        key_pieces_str = map(lambda x: str(x), key_pieces)
-        key_output = '\t'.join(key_pieces_str)
+        key_pieces = [year, survey, record['hauljoin'] if packed else haul]
+
+        if haul_ids is None:
+            key_pieces_str = map(lambda x: str(x), key_pieces)
+            key_output = '\t'.join(key_pieces_str)
+        else:
+            key_output = haul_ids[tuple(key_pieces)]
+
         return {
             'value': value,
             'keys': set([key_output])
         }
 
-    template_vals = (year, survey, haul)
-    flat_loc = 'joined/%d_%s_%d.avro' % template_vals
-    flat_records = get_avro(flat_loc)
+    def generate_columnar(flat_records):
+        import numpy
+
+        num_records = len(flat_records)
+        if num_records == 0:
+            return dict(map(lambda x: (x, []), keys))
+
+        def get_float_column(field):
+            values = map(
+                lambda x: numpy.nan if x[field] is None else x[field],
+                flat_records
+            )
+            return numpy.fromiter(values, dtype=float, count=num_records)
+
+        def get_str_column(field, get_str):
+            values = map(lambda x: x[field], flat_records)
+            values_strs = map(
+                lambda x: NULL_GROUP if x is None else get_str(x),
+                values
+            )
+            return numpy.array(list(values_strs))
+
+        def get_group_strs(key):
+            if key in REQUIRES_ROUNDING:
+                values = get_float_column(key)
+                values_strs = numpy.char.mod('%.2f', values)
+                is_null = numpy.isnan(values)
+                return numpy.where(is_null, NULL_GROUP, values_strs)
+            elif key in REQUIRES_DATE_ROUND:
+                values_strs = get_str_column(key, str)
+                return numpy.char.partition(values_strs, 'T')[:, 0]
+            else:
+                return get_str_column(key, repr)
+
+        non_zero = functools.reduce(
+            numpy.logical_or,
+            map(lambda x: get_float_column(x) > 0, NON_ZERO_FIELDS)
+        )
+        all_indices = numpy.arange(num_records)
+        non_zero_indices = numpy.flatnonzero(non_zero)
+        hauls_strs = numpy.char.add('\t', get_str_column('hauljoin', str))
+
+        def generate_for_key(key):
+            if key in IGNORE_ZEROS:
+                allowed_indices = non_zero_indices
+            else:
+                allowed_indices = all_indices
+
+            group_strs = numpy.char.add(
+                get_group_strs(key)[allowed_indices],
+                hauls_strs[allowed_indices]
+            )
+            unique_strs, first_indices = numpy.unique(
+                group_strs,
+                return_index=True
+            )
+            selected_indices = allowed_indices[numpy.sort(first_indices)]
+
+            index_records = map(
+                lambda x: generate_index_record(flat_records[x], key),
+                selected_indices
+            )
+            return list(index_records)
+
+        return dict(map(lambda x: (x, generate_for_key(x)), keys))
 
     def is_non_zero(target):
         def is_field_non_zero(field):
             value = target[field]
             return (value is not None) and (value > 0)
 
-        fields = ['cpue_kgkm2', 'cpue_nokm2', 'weight_kg', 'count']
-        flags = map(is_field_non_zero, fields)
+        flags = map(is_field_non_zero, NON_ZERO_FIELDS)
         flags_positive = filter(lambda x: x is True, flags)
         num_flags_positive = sum(map(lambda x: 1, flags_positive))
         return num_flags_positive > 0
 
-    if key in IGNORE_ZEROS:
-        flat_records_allowed = filter(is_non_zero, flat_records)
+    def generate_rows(flat_records):
+        flat_records_non_zero = list(filter(is_non_zero, flat_records))
+
+        def generate_for_key(key):
+            if key in IGNORE_ZEROS:
+                flat_records_allowed = flat_records_non_zero
+            else:
+                flat_records_allowed = flat_records
+
+            index_records = map(
+                lambda x: generate_index_record(x, key),
+                flat_records_allowed
+            )
+            return dedupe_index_records(key, index_records)
+
+        return dict(map(lambda x: (x, generate_for_key(x)), keys))
+
+    if packed:
+        hauls_records = map(
+            list,
+            joined.read_packed_hauls(storage, year, survey, species_by_code)
+        )
     else:
-        flat_records_allowed = flat_records
+        template_vals = (year, survey, haul)
+        flat_loc = 'joined/%d_%s_%d.avro' % template_vals
+        hauls_records = [get_avro(flat_loc)]
 
-    index_records = map(generate_index_record, flat_records_allowed)
+    generate_haul = generate_columnar if columnar else generate_rows
+    index_records_by_key = dict(map(lambda x: (x, []), keys))
+    for flat_records in hauls_records:
+        for key, index_records in generate_haul(flat_records).items():
+            index_records_by_key[key].extend(index_records)
 
-    return list(index_records)
+    return index_records_by_key
+
+
+def get_group_value(key, value):
+    if value is None:
+        return None
+    elif key in REQUIRES_ROUNDING:
+        return '%.2f' % value
+    elif key in REQUIRES_DATE_ROUND:
+        return value.split('T')[0]
+    else:
+        return value
+
+
+def dedupe_index_records(key, index_records):
+    index_records_by_group = {}
+    for record in index_records:
+        group = repr(get_group_value(key, record['value']))
+        haul_key = next(iter(record['keys']))
+        index_records_by_group.setdefault((group, haul_key), record)
+
+    return list(index_records_by_group.values())
 
 
 def build_output_record(target):
@@ -124,15 +235,15 @@ def build_output_record(target):
     }
 
 
-def get_observations_meta(bucket):
-    access_key = os.environ['AWS_ACCESS_KEY']
-    access_secret = os.environ['AWS_ACCESS_SECRET']
+def build_compact_output_record(target):
+    return {
+        'value': target['value'],
+        'hauls': postings.encode_deltas(target['keys'])
+    }
 
-    s3_client = boto3.client(
-        's3',
-        aws_access_key_id=access_key,
-        aws_secret_access_key=access_secret
-    )
+
+def get_observations_meta(bucket):
+    storage = storage_lib.get_storage(bucket)
 
     def make_haul_metadata_record(path):
         filename_with_path = path.split('/')[-1]
@@ -145,22 +256,36 @@ def get_observations_meta(bucket):
             'haul': int(components[2])
         }
 
-    paginator = s3_client.get_paginator('list_objects_v2')
-    iterator = paginator.paginate(Bucket=bucket, Prefix='joined/')
-    pages = filter(lambda x: 'Contents' in x, iterator)
-    contents = map(lambda x: x['Contents'], pages)
-    contents_flat = itertools.chain(*contents)
-    keys = map(lambda x: x['Key'], contents_flat)
+    keys = storage.list('joined/')
     return map(make_haul_metadata_record, keys)
 
 
-def write_sample(key, bucket, sample):
+def get_packed_meta(bucket):
+    storage = storage_lib.get_storage(bucket)
+
+    def make_group_metadata_record(path):
+        filename_with_path = path.split('/')[-1]
+        filename = filename_with_path.split('.')[0]
+        components = filename.split('_')
+        return {
+            'path': path,
+            'year': int(components[0]),
+            'survey': components[1],
+            'haul': None
+        }
+
+    keys = storage.list(joined.PACKED_PREFIX)
+    keys_data = filter(lambda x: not joined.is_packed_index_loc(x), keys)
+    return map(make_group_metadata_record, keys_data)
+
+
+def write_sample(key, bucket, sample, main_fingerprint=None):
     import io
-    import os
     import random
 
-    import boto3
-    import fastavro
+    import postings
+    import records as records_lib
+    import storage as storage_lib
 
     INDEX_SCHEMA = {
         'doc': 'Index from a value to an observations flat file.',
@@ -190,24 +315,24 @@ def write_sample(key, bucket, sample):
 
     batch = random.randint(0, 1000000)
 
-    access_key = os.environ.get('AWS_ACCESS_KEY', '')
-    access_secret = os.environ.get('AWS_ACCESS_SECRET', '')
+    if main_fingerprint is not None:
+        schema = postings.COMPACT_INDEX_SCHEMA
+        metadata = postings.make_compact_metadata(main_fingerprint)
+    else:
+        schema = INDEX_SCHEMA
+        metadata = None
 
     target_buffer = io.BytesIO()
-    fastavro.writer(
+    records_lib.compile_schema(schema).write(
         target_buffer,
-        INDEX_SCHEMA,
-        sample_realized
+        sample_realized,
+        metadata=metadata
     )
     target_buffer.seek(0)
 
-    s3_client = boto3.client(
-        's3',
-        aws_access_key_id=access_key,
-        aws_secret_access_key=access_secret
-    )
+    storage = storage_lib.get_storage(bucket)
     output_loc = 'index_sharded/%s_%d.avro' % (key, batch)
-    s3_client.upload_fileobj(target_buffer, bucket, output_loc)
+    storage.put(output_loc, target_buffer)
     return batch
 
 
@@ -216,75 +341,124 @@ def assign_batch(target):
     return {'batch': random.randint(0, 100), 'target': [target]}
 
 
+def parse_options(args):
+    flags = filter(lambda x: x.startswith('--'), args)
+    pairs = map(lambda x: x[2:].split('=', 1), flags)
+    return dict(map(lambda x: (x[0], x[1] if len(x) > 1 else ''), pairs))
+
+
 def main():
-    if len(sys.argv) != NUM_ARGS + 1:
+    args = list(filter(lambda x: not x.startswith('--'), sys.argv))
+    options = parse_options(sys.argv[1:])
+
+    if len(args) != NUM_ARGS + 1:
         print(USAGE_STR)
         sys.exit(1)
 
-    bucket = sys.argv[1]
-    keys = sys.argv[2].split(',')
-    hauls_meta = list(get_observations_meta(bucket))
-
-    access_key = os.environ.get('AWS_ACCESS_KEY', '')
-    access_secret = os.environ.get('AWS_ACCESS_SECRET', '')
-    cluster = coiled.Cluster(
-        name='DseProcessAfscgap',
-        n_workers=100,
-        worker_vm_types=['m7a.medium'],
-        scheduler_vm_types=['m7a.medium'],
-        environ={
-            'AWS_ACCESS_KEY': access_key,
-            'AWS_ACCESS_SECRET': access_secret
+    bucket = args[1]
+    keys = args[2].split(',')
+    batch_size = int(options.get('batch-size', DEFAULT_BATCH_SIZE))
+    packed = 'packed' in options
+    compact = 'haul-ids' in options
+    columnar = 'columnar' in options
+
+    if packed:
+        hauls_meta = list(get_packed_meta(bucket))
+    else:
+        hauls_meta = list(get_observations_meta(bucket))
+
+    engine = options.get('engine', execution_lib.DEFAULT_ENGINE)
+    execution = execution_lib.start_cluster(
+        engine,
+        execution_lib.get_n_workers(options, engine, DEFAULT_COILED_WORKERS),
+        {
+            'AWS_ACCESS_KEY': os.environ.get('AWS_ACCESS_KEY', ''),
+            'AWS_ACCESS_SECRET': os.environ.get('AWS_ACCESS_SECRET', ''),
+            records_lib.CODEC_ENV: records_lib.get_codec()
         }
     )
-    client = cluster.get_client()
+    client = execution['client']
 
-    def execute_for_key(key):
-        hauls_meta_realized = dask.bag.from_sequence(hauls_meta)
-        index_records_nest = hauls_meta_realized.map(
-            lambda x: process_file(
-                bucket,
-                x['year'],
-                x['survey'],
-                x['haul'],
-                key
-            )
+    species_by_code = joined.load_species(storage_lib.get_storage(bucket))
+    species_delayed = dask.delayed(species_by_code)
+
+    if compact:
+        main_index = postings.load_main_index(
+            storage_lib.get_storage(bucket)
         )
+        haul_ids = postings.make_haul_ids(main_index['haul_keys'])
+        main_fingerprint = main_index['fingerprint']
+        output_builder = build_compact_output_record
+    else:
+        haul_ids = None
+        main_fingerprint = None
+        output_builder = build_output_record
+
+    haul_ids_delayed = dask.delayed(haul_ids)
+
+    hauls_meta_realized = dask.bag.from_sequence(
+        hauls_meta,
+        partition_size=1 if packed else batch_size
+    )
+    index_records_by_key = hauls_meta_realized.map(
+        lambda x, species, ids: process_file(
+            bucket,
+            x['year'],
+            x['survey'],
+            x['haul'],
+            keys,
+            species,
+            packed=packed,
+            haul_ids=ids,
+            columnar=columnar
+        ),
+        species=species_delayed,
+        ids=haul_ids_delayed
+    )
+
+    def build_for_key(key):
+        index_records_nest = index_records_by_key.pluck(key)
         index_records = index_records_nest.flatten()
 
         def key_record(target):
-            if key in REQUIRES_ROUNDING:
-                if target['value'] is None:
-                    return target['value']
-                else:
-                    return '%.2f' % target['value']
-            elif key in REQUIRES_DATE_ROUND:
-                if target['value'] is None:
-                    return target['value']
-                else:
-                    return target['value'].split('T')[0]
-            else:
-                return target['value']
+            return get_group_value(key, target['value'])
 
         def combine_records(a, b):
             return {'value': a['value'], 'keys': a['keys'].union(b['keys'])}
 
+        def combine_group(group):
+            return functools.reduce(combine_records, group[1])
+
         if key in REQUIRES_FLAT:
-            index_records_output = index_records.map(build_output_record)
+            index_records_grouped_nest = index_records.groupby(
+                key_record,
+                shuffle='tasks'
+            )
+            index_records_grouped = index_records_grouped_nest.map(
+                combine_group
+            )
+            index_records_output = index_records_grouped.map(output_builder)
         else:
             index_records_grouped_nest = index_records.foldby(
                 key=key_record,
                 binop=combine_records
             )
-            index_records_grouped = index_records_grouped_nest.map(lambda x: x[1])
-            index_records_output = index_records_grouped.map(build_output_record)
+            index_records_grouped = index_records_grouped_nest.map(
+                lambda x: x[1]
+            )
+            index_records_output = index_records_grouped.map(output_builder)
 
         repartitioned = index_records_output.repartition(npartitions=20)
-        incidies_future = repartitioned.map_partitions(
-            lambda x: write_sample(key, bucket, x)
+        return repartitioned.map_partitions(
+            lambda x: write_sample(
+                key,
+                bucket,
+                x,
+                main_fingerprint=main_fingerprint
+            )
         )
 
-        indicies_all = incidies_future.compute(scheduler=client)
+    def write_shard_list(key, indicies_all):
         indicies = filter(lambda x: x is not None, indicies_all)
         indicies_strs = list(map(lambda x: str(x), indicies))
         assert len(indicies_strs) == len(set(indicies_strs))
@@ -293,11 +467,14 @@ def main():
         with open(loc, 'w') as f:
             f.write('\n'.join(indicies_strs))
 
-    for key in keys:
-        print('Executing for %s...' % key)
-        execute_for_key(key)
+    print('Executing for %s...' % ', '.join(keys))
+    incidies_futures = list(map(build_for_key, keys))
+    indicies_by_key = dask.compute(*incidies_futures, scheduler=client)
+
+    for key, indicies_all in zip(keys, indicies_by_key):
+        write_shard_list(key, indicies_all)
 
-    cluster.close(force_shutdown=True)
+    execution_lib.stop_cluster(execution)
 
 
 if __name__ == '__main__':
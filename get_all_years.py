@@ -0,0 +1,56 @@
+import sys
+
+import request_source
+
+NUM_ARGS = 4
+USAGE_STR = (
+    'python get_all_years.py [bucket] [start year] [end year] [types] '
+    '[--workers=n] [--jobs=n] [--concurrency=n] [--partitions=n] '
+    '[--buffered] [--buffer-records=n] [--staging=dir] [--resume] '
+    '[--domain=url] [--max-page-size=n] [--max-retries=n] [--delta] '
+    '[--changed=path]'
+)
+YEARLY_TYPES = {'haul'}
+PARTITIONED_TYPES = {'catch'}
+
+
+def get_jobs(start_year, end_year, type_names, num_partitions):
+    for type_name in type_names:
+        if type_name in YEARLY_TYPES:
+            for year in range(start_year, end_year + 1):
+                yield {'type': type_name, 'loc': type_name, 'year': year}
+        elif type_name in PARTITIONED_TYPES and num_partitions is not None:
+            yield {
+                'type': type_name,
+                'loc': type_name,
+                'year': None,
+                'partitions': num_partitions
+            }
+        else:
+            yield {'type': type_name, 'loc': type_name, 'year': None}
+
+
+def main():
+    args = list(filter(lambda x: not x.startswith('--'), sys.argv))
+    options = request_source.parse_options(sys.argv[1:])
+
+    if len(args) != NUM_ARGS + 1:
+        print(USAGE_STR)
+        sys.exit(1)
+
+    bucket = args[1]
+    start_year = int(args[2])
+    end_year = int(args[3])
+    type_names = args[4].split(',')
+
+    if 'partitions' in options:
+        num_partitions = int(options['partitions'])
+    else:
+        num_partitions = None
+
+    jobs = get_jobs(start_year, end_year, type_names, num_partitions)
+    request_source.run_jobs(bucket, list(jobs), options)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,76 +1 @@
-echo "area_swept_km2"
-python generate_indicies.py $BUCKET_NAME area_swept_km2
-echo "bottom_temperature_c"
-python generate_indicies.py $BUCKET_NAME bottom_temperature_c
-echo "common_name"
-python generate_indicies.py $BUCKET_NAME common_name
-echo "count"
-python generate_indicies.py $BUCKET_NAME count
-echo "cpue_kgkm2"
-python generate_indicies.py $BUCKET_NAME cpue_kgkm2
-echo "cpue_nokm2"
-python generate_indicies.py $BUCKET_NAME cpue_nokm2
-echo "cruise"
-python generate_indicies.py $BUCKET_NAME cruise
-echo "cruisejoin"
-python generate_indicies.py $BUCKET_NAME cruisejoin
-echo "date_time"
-python generate_indicies.py $BUCKET_NAME date_time
-echo "depth_m"
-python generate_indicies.py $BUCKET_NAME depth_m
-echo "distance_fished_km"
-python generate_indicies.py $BUCKET_NAME distance_fished_km
-echo "duration_hr"
-python generate_indicies.py $BUCKET_NAME duration_hr
-echo "haul"
-python generate_indicies.py $BUCKET_NAME haul
-echo "hauljoin"
-python generate_indicies.py $BUCKET_NAME hauljoin
-echo "id_rank"
-python generate_indicies.py $BUCKET_NAME id_rank
-echo "latitude_dd_end"
-python generate_indicies.py $BUCKET_NAME latitude_dd_end
-echo "latitude_dd_start"
-python generate_indicies.py $BUCKET_NAME latitude_dd_start
-echo "longitude_dd_end"
-python generate_indicies.py $BUCKET_NAME longitude_dd_end
-echo "longitude_dd_start"
-python generate_indicies.py $BUCKET_NAME longitude_dd_start
-echo "net_height_m"
-python generate_indicies.py $BUCKET_NAME net_height_m
-echo "net_width_m"
-python generate_indicies.py $BUCKET_NAME net_width_m
-echo "performance"
-python generate_indicies.py $BUCKET_NAME performance
-echo "requirements"
-python generate_indicies.py $BUCKET_NAME requirements
-echo "scientific_name"
-python generate_indicies.py $BUCKET_NAME scientific_name
-echo "species_code"
-python generate_indicies.py $BUCKET_NAME species_code
-echo "srvy"
-python generate_indicies.py $BUCKET_NAME srvy
-echo "station"
-python generate_indicies.py $BUCKET_NAME station
-echo "stratum"
-python generate_indicies.py $BUCKET_NAME stratum
-echo "surface_temperature_c"
-python generate_indicies.py $BUCKET_NAME surface_temperature_c
-echo "survey"
-python generate_indicies.py $BUCKET_NAME survey
-echo "survey_definition_id"
-python generate_indicies.py $BUCKET_NAME survey_definition_id
-echo "survey_name"
-python generate_indicies.py $BUCKET_NAME survey_name
-echo "taxon_confidence"
-python generate_indicies.py $BUCKET_NAME taxon_confidence
-echo "variables"
-python generate_indicies.py $BUCKET_NAME variables
-echo "vessel_id"
-python generate_indicies.py $BUCKET_NAME vessel_id
-echo "vessel_name"
-python generate_indicies.py $BUCKET_NAME vessel_name
-echo "weight_kg"
-python generate_indicies.py $BUCKET_NAME weight_kg
-echo "year"
-python generate_indicies.py $BUCKET_NAME year
+python generate_indicies.py $BUCKET_NAME area_swept_km2,bottom_temperature_c,common_name,count,cpue_kgkm2,cpue_nokm2,cruise,cruisejoin,date_time,depth_m,distance_fished_km,duration_hr,haul,hauljoin,id_rank,latitude_dd_end,latitude_dd_start,longitude_dd_end,longitude_dd_start,net_height_m,net_width_m,performance,scientific_name,species_code,srvy,station,stratum,surface_temperature_c,survey,survey_definition_id,survey_name,taxon_confidence,vessel_id,vessel_name,weight_kg,year
@@ -0,0 +1,377 @@
+import bisect
+import hashlib
+import io
+import itertools
+import math
+
+import fastavro
+
+import joined
+import records as records_lib
+import storage as storage_lib
+
+DEFAULT_BLOCK_RECORDS = 500
+BLOOM_FALSE_POSITIVE_RATE = 0.01
+NUMERIC_TYPES = {'int', 'long', 'float', 'double'}
+
+BLOCK_SCHEMA = {
+    'doc': 'Value range and byte range of a block in a sorted index.',
+    'name': 'IndexBlock',
+    'namespace': 'edu.dse.afscgap',
+    'type': 'record',
+    'fields': [
+        {'name': 'start', 'type': 'long'},
+        {'name': 'end', 'type': 'long'},
+        {'name': 'min', 'type': ['double', 'null']},
+        {'name': 'max', 'type': ['double', 'null']},
+        {'name': 'count', 'type': 'long'},
+        {'name': 'nulls', 'type': 'long'}
+    ]
+}
+
+DICTIONARY_SCHEMA = {
+    'doc': 'Byte range of the blocks holding a value in a sorted index.',
+    'name': 'IndexDictionaryEntry',
+    'namespace': 'edu.dse.afscgap',
+    'type': 'record',
+    'fields': [
+        {'name': 'value', 'type': ['string', 'long', 'double', 'null']},
+        {'name': 'start', 'type': 'long'},
+        {'name': 'end', 'type': 'long'}
+    ]
+}
+
+BLOOM_SCHEMA = {
+    'doc': 'Bloom filter over the values present in an index.',
+    'name': 'IndexBloom',
+    'namespace': 'edu.dse.afscgap',
+    'type': 'record',
+    'fields': [
+        {'name': 'num_bits', 'type': 'long'},
+        {'name': 'num_hashes', 'type': 'int'},
+        {'name': 'bits', 'type': 'bytes'}
+    ]
+}
+
+
+def get_index_loc(key):
+    return 'index/%s.avro' % key
+
+
+def get_blocks_loc(key):
+    return 'index/%s.blocks.avro' % key
+
+
+def get_dictionary_loc(key):
+    return 'index/%s.dictionary.avro' % key
+
+
+def get_bloom_loc(key):
+    return 'index/%s.bloom.avro' % key
+
+
+def get_numeric_value(value):
+    if value is None:
+        return None
+    else:
+        return float(value)
+
+
+def get_numeric_keys(schema):
+
+    def is_numeric_field(field):
+        field_type = field['type']
+        types = field_type if isinstance(field_type, list) else [field_type]
+        return any(map(lambda x: x in NUMERIC_TYPES, types))
+
+    numeric_fields = filter(is_numeric_field, schema['fields'])
+    return set(map(lambda x: x['name'], numeric_fields))
+
+
+def sort_numeric(records):
+    def get_sort_key(record):
+        value = get_numeric_value(record['value'])
+        return (value is None, 0 if value is None else value)
+
+    return sorted(records, key=get_sort_key)
+
+
+def get_value_sort_key(value):
+    return (value is None, '' if value is None else str(value))
+
+
+def sort_values(records):
+    return sorted(records, key=lambda x: get_value_sort_key(x['value']))
+
+
+def summarize_block(records, start, end):
+    values = map(lambda x: get_numeric_value(x['value']), records)
+    values_present = list(filter(lambda x: x is not None, values))
+    return {
+        'start': start,
+        'end': end,
+        'min': min(values_present) if len(values_present) > 0 else None,
+        'max': max(values_present) if len(values_present) > 0 else None,
+        'count': len(records),
+        'nulls': len(records) - len(values_present)
+    }
+
+
+def write_blocked(compiled_schema, records_sorted, metadata=None,
+    block_records=DEFAULT_BLOCK_RECORDS):
+    target_buffer = io.BytesIO()
+    writer = compiled_schema.make_writer(target_buffer, metadata=metadata)
+    writer.flush()
+    header_size = target_buffer.tell()
+
+    blocks = []
+    for i in range(0, len(records_sorted), block_records):
+        block = records_sorted[i:i + block_records]
+        start = target_buffer.tell()
+        for record in block:
+            writer.write(record)
+        writer.flush()
+        blocks.append({
+            'start': start,
+            'end': target_buffer.tell(),
+            'records': block
+        })
+
+    target_buffer.seek(0)
+    return {
+        'buffer': target_buffer,
+        'blocks': blocks,
+        'header_size': header_size
+    }
+
+
+def write_sidecar(storage, loc, schema, records, metadata=None):
+    target_buffer = io.BytesIO()
+    records_lib.compile_schema(schema).write(
+        target_buffer,
+        records,
+        metadata=metadata
+    )
+    target_buffer.seek(0)
+    storage.put(loc, target_buffer)
+
+
+def write_blocks(storage, key, blocked):
+    blocks = map(
+        lambda x: summarize_block(x['records'], x['start'], x['end']),
+        blocked['blocks']
+    )
+    write_sidecar(
+        storage,
+        get_blocks_loc(key),
+        BLOCK_SCHEMA,
+        blocks,
+        metadata={joined.HEADER_SIZE_KEY: str(blocked['header_size'])}
+    )
+
+
+def make_dictionary(blocks):
+    entries = []
+    for block in blocks:
+        for record in block['records']:
+            value = record['value']
+            is_same = len(entries) > 0 and entries[-1]['value'] == value
+            if is_same:
+                entries[-1]['end'] = block['end']
+            else:
+                entries.append({
+                    'value': value,
+                    'start': block['start'],
+                    'end': block['end']
+                })
+    return entries
+
+
+def write_dictionary(storage, key, blocked):
+    write_sidecar(
+        storage,
+        get_dictionary_loc(key),
+        DICTIONARY_SCHEMA,
+        make_dictionary(blocked['blocks']),
+        metadata={joined.HEADER_SIZE_KEY: str(blocked['header_size'])}
+    )
+
+
+def get_bloom_positions(value, num_bits, num_hashes):
+    digest = hashlib.sha256(str(value).encode('utf-8')).digest()
+    first = int.from_bytes(digest[:8], 'little')
+    second = int.from_bytes(digest[8:16], 'little') | 1
+    return map(
+        lambda x: (first + x * second) % num_bits,
+        range(num_hashes)
+    )
+
+
+def make_bloom(values):
+    values_realized = list(values)
+    num_values = max(len(values_realized), 1)
+    num_bits = math.ceil(
+        -num_values * math.log(BLOOM_FALSE_POSITIVE_RATE) / math.log(2) ** 2
+    )
+    num_bits = max(num_bits, 8)
+    num_hashes = max(round(num_bits / num_values * math.log(2)), 1)
+
+    bits = bytearray((num_bits + 7) // 8)
+    for value in values_realized:
+        for position in get_bloom_positions(value, num_bits, num_hashes):
+            bits[position // 8] |= 1 << (position % 8)
+
+    return {
+        'num_bits': num_bits,
+        'num_hashes': num_hashes,
+        'bits': bytes(bits)
+    }
+
+
+def is_in_bloom(bloom, value):
+    positions = get_bloom_positions(
+        value,
+        bloom['num_bits'],
+        bloom['num_hashes']
+    )
+    return all(map(
+        lambda x: bloom['bits'][x // 8] & (1 << (x % 8)) != 0,
+        positions
+    ))
+
+
+def write_bloom(storage, key, blocked):
+    records = itertools.chain(*map(lambda x: x['records'], blocked['blocks']))
+    values = set(map(lambda x: x['value'], records))
+    values_present = filter(lambda x: x is not None, values)
+    write_sidecar(
+        storage,
+        get_bloom_loc(key),
+        BLOOM_SCHEMA,
+        [make_bloom(values_present)]
+    )
+
+
+def read_sidecar(storage, loc):
+    reader = fastavro.reader(storage.get(loc))
+    header_size = int(reader.metadata.get(joined.HEADER_SIZE_KEY, '0'))
+    return {'header_size': header_size, 'records': list(reader)}
+
+
+def read_blocks(storage, key):
+    sidecar = read_sidecar(storage, get_blocks_loc(key))
+    return {
+        'header_size': sidecar['header_size'],
+        'blocks': sidecar['records']
+    }
+
+
+def read_index_metadata(storage, key):
+    try:
+        sidecar = read_sidecar(storage, get_blocks_loc(key))
+    except storage_lib.MissingObjectError:
+        sidecar = read_sidecar(storage, get_dictionary_loc(key))
+
+    header = storage.get_range(get_index_loc(key), 0, sidecar['header_size'])
+    return fastavro.reader(header).metadata
+
+
+def is_block_overlapping(block, min_value, max_value):
+    if block['min'] is None:
+        return False
+
+    above_min = min_value is None or block['max'] >= min_value
+    below_max = max_value is None or block['min'] <= max_value
+    return above_min and below_max
+
+
+def get_contiguous_ranges(blocks):
+    ranges = []
+    for block in blocks:
+        if len(ranges) > 0 and ranges[-1][1] == block['start']:
+            ranges[-1] = (ranges[-1][0], block['end'])
+        else:
+            ranges.append((block['start'], block['end']))
+    return ranges
+
+
+def read_range(storage, key, min_value=None, max_value=None):
+    blocks_info = read_blocks(storage, key)
+    blocks = filter(
+        lambda x: is_block_overlapping(x, min_value, max_value),
+        blocks_info['blocks']
+    )
+    ranges = get_contiguous_ranges(blocks)
+
+    def is_in_range(record):
+        value = get_numeric_value(record['value'])
+        if value is None:
+            return False
+
+        above_min = min_value is None or value >= min_value
+        below_max = max_value is None or value <= max_value
+        return above_min and below_max
+
+    records = read_index_ranges(
+        storage,
+        key,
+        blocks_info['header_size'],
+        ranges
+    )
+    return list(filter(is_in_range, records))
+
+
+def read_index_ranges(storage, key, header_size, ranges):
+    if len(ranges) == 0:
+        return []
+
+    index_loc = get_index_loc(key)
+    header = storage.get_range(index_loc, 0, header_size)
+    header_bytes = header.read()
+
+    def read_records(byte_range):
+        blocks_buffer = storage.get_range(index_loc, *byte_range)
+        source_buffer = io.BytesIO(header_bytes + blocks_buffer.read())
+        return fastavro.reader(source_buffer)
+
+    records_nest = map(read_records, ranges)
+    return itertools.chain(*records_nest)
+
+
+def scan_value(storage, key, value):
+    records = fastavro.reader(storage.get(get_index_loc(key)))
+    return list(filter(lambda x: str(x['value']) == str(value), records))
+
+
+def lookup_value(storage, key, value, numeric=False):
+    if numeric:
+        numeric_value = float(value)
+        return read_range(storage, key, numeric_value, numeric_value)
+
+    try:
+        bloom_sidecar = read_sidecar(storage, get_bloom_loc(key))
+    except storage_lib.MissingObjectError:
+        return scan_value(storage, key, value)
+
+    if not is_in_bloom(bloom_sidecar['records'][0], value):
+        return []
+
+    dictionary = read_sidecar(storage, get_dictionary_loc(key))
+    entries = dictionary['records']
+    entry_keys = list(map(lambda x: get_value_sort_key(x['value']), entries))
+    position = bisect.bisect_left(entry_keys, get_value_sort_key(value))
+
+    if position >= len(entries):
+        return []
+
+    entry = entries[position]
+    if str(entry['value']) != str(value):
+        return []
+
+    records = read_index_ranges(
+        storage,
+        key,
+        dictionary['header_size'],
+        [(entry['start'], entry['end'])]
+    )
+    return list(filter(lambda x: str(x['value']) == str(value), records))
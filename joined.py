@@ -0,0 +1,216 @@
+import hashlib
+import io
+import itertools
+import json
+
+import fastavro
+
+import storage as storage_lib
+
+SPECIES_CATALOG_LOC = 'catalog/species.avro'
+RENDER_MANIFEST_LOC = 'manifest/joined.json'
+PACKED_PREFIX = 'joined_packed/'
+PACKED_INDEX_SUFFIX = '.index.avro'
+HEADER_SIZE_KEY = 'afscgap.header_size'
+FORMAT_KEY = 'afscgap.format'
+HAUL_KEY = 'afscgap.haul'
+CATALOG_KEY = 'afscgap.catalog'
+COMPACT_FORMAT = 'compact'
+FULL_FORMAT = 'full'
+
+ZERO_FIELDS = {
+    'cpue_kgkm2': 0,
+    'cpue_nokm2': 0,
+    'count': 0,
+    'weight_kg': 0,
+    'taxon_confidence': None,
+    'complete': True
+}
+
+PACKED_INDEX_SCHEMA = {
+    'doc': 'Byte range of a haul within a packed joined file.',
+    'name': 'PackedHaul',
+    'namespace': 'edu.dse.afscgap',
+    'type': 'record',
+    'fields': [
+        {'name': 'year', 'type': 'int'},
+        {'name': 'survey', 'type': 'string'},
+        {'name': 'haul', 'type': 'long'},
+        {'name': 'start', 'type': 'long'},
+        {'name': 'end', 'type': 'long'}
+    ]
+}
+
+SPECIES_FIELDS = [
+    'species_code',
+    'scientific_name',
+    'common_name',
+    'id_rank',
+    'worms',
+    'itis'
+]
+
+
+def load_species(storage):
+    try:
+        records_flat = fastavro.reader(storage.get(SPECIES_CATALOG_LOC))
+    except storage_lib.MissingObjectError:
+        print('Species catalog not found. Reading individual species...')
+        keys = storage.list('species/')
+        buffers = storage_lib.get_all(storage, keys)
+        records_nest = map(fastavro.reader, buffers)
+        records_flat = itertools.chain(*records_nest)
+
+    records_tuples = map(lambda x: (x['species_code'], x), records_flat)
+    return dict(records_tuples)
+
+
+def get_catalog_version(species_by_code):
+    records_sorted = sorted(species_by_code.items())
+    serialized = json.dumps(records_sorted, separators=(',', ':'))
+    return hashlib.sha256(serialized.encode('utf-8')).hexdigest()
+
+
+def load_render_manifest(storage):
+    try:
+        return json.loads(storage.get(RENDER_MANIFEST_LOC).read())
+    except storage_lib.MissingObjectError:
+        return {}
+
+
+def save_render_manifest(storage, manifest):
+    target_buffer = io.BytesIO()
+    target_buffer.write(json.dumps(manifest).encode('utf-8'))
+    target_buffer.seek(0)
+    storage.put(RENDER_MANIFEST_LOC, target_buffer)
+
+
+def make_zero_template(haul_record):
+    template = dict(haul_record)
+    template.update(ZERO_FIELDS)
+    return template
+
+
+def make_zero_record(template, species):
+    record = template.copy()
+    for field in SPECIES_FIELDS:
+        record[field] = species[field]
+    return record
+
+
+def get_missing_codes(observed_records, species_by_code):
+    species_codes_found = set(map(
+        lambda x: x.get('species_code', None),
+        observed_records
+    ))
+    species_codes_all = set(species_by_code.keys())
+    return sorted(species_codes_all - species_codes_found)
+
+
+def make_zero_records(haul_record, observed_records, species_by_code):
+    template = make_zero_template(haul_record)
+    species_codes_missing = get_missing_codes(
+        observed_records,
+        species_by_code
+    )
+    return map(
+        lambda x: make_zero_record(template, species_by_code[x]),
+        species_codes_missing
+    )
+
+
+def make_compact_metadata(haul_record):
+    return {
+        FORMAT_KEY: COMPACT_FORMAT,
+        HAUL_KEY: json.dumps(haul_record),
+        CATALOG_KEY: SPECIES_CATALOG_LOC
+    }
+
+
+def is_compact(reader):
+    return reader.metadata.get(FORMAT_KEY, FULL_FORMAT) == COMPACT_FORMAT
+
+
+def expand_records(reader, species_by_code):
+    if not is_compact(reader):
+        yield from reader
+        return
+
+    haul_record = json.loads(reader.metadata[HAUL_KEY])
+    observed_records = list(reader)
+    zero_records = make_zero_records(
+        haul_record,
+        observed_records,
+        species_by_code
+    )
+    yield from observed_records
+    yield from zero_records
+
+
+def read_joined(source_buffer, species_by_code):
+    reader = fastavro.reader(source_buffer)
+    return expand_records(reader, species_by_code)
+
+
+def get_packed_loc(year, survey):
+    return PACKED_PREFIX + '%d_%s.avro' % (year, survey)
+
+
+def get_packed_index_loc(year, survey):
+    return PACKED_PREFIX + '%d_%s%s' % (year, survey, PACKED_INDEX_SUFFIX)
+
+
+def is_packed_index_loc(loc):
+    return loc.endswith(PACKED_INDEX_SUFFIX)
+
+
+def read_packed_index(storage, year, survey):
+    reader = fastavro.reader(storage.get(get_packed_index_loc(year, survey)))
+    header_size = int(reader.metadata[HEADER_SIZE_KEY])
+    return {'header_size': header_size, 'entries': list(reader)}
+
+
+def read_packed_entry(storage, year, survey, header_bytes, entry,
+    species_by_code):
+    packed_loc = get_packed_loc(year, survey)
+    blocks = storage.get_range(packed_loc, entry['start'], entry['end'])
+    source_buffer = io.BytesIO(header_bytes + blocks.read())
+    return read_joined(source_buffer, species_by_code)
+
+
+def read_packed_header(storage, year, survey, packed_index):
+    packed_loc = get_packed_loc(year, survey)
+    header = storage.get_range(packed_loc, 0, packed_index['header_size'])
+    return header.read()
+
+
+def read_packed_hauls(storage, year, survey, species_by_code):
+    packed_index = read_packed_index(storage, year, survey)
+    header_bytes = read_packed_header(storage, year, survey, packed_index)
+    for entry in packed_index['entries']:
+        yield read_packed_entry(
+            storage,
+            year,
+            survey,
+            header_bytes,
+            entry,
+            species_by_code
+        )
+
+
+def read_packed_haul(storage, year, survey, haul, species_by_code):
+    packed_index = read_packed_index(storage, year, survey)
+    matching = filter(lambda x: x['haul'] == haul, packed_index['entries'])
+    entry = next(matching, None)
+    if entry is None:
+        raise storage_lib.MissingObjectError('%d_%s_%d' % (year, survey, haul))
+
+    header_bytes = read_packed_header(storage, year, survey, packed_index)
+    return read_packed_entry(
+        storage,
+        year,
+        survey,
+        header_bytes,
+        entry,
+        species_by_code
+    )
@@ -0,0 +1,81 @@
+import hashlib
+import itertools
+import json
+
+import fastavro
+
+MAIN_INDEX_LOC = 'index/main.avro'
+POSTINGS_KEY = 'afscgap.postings'
+MAIN_FINGERPRINT_KEY = 'afscgap.main_index'
+DELTA_POSTINGS = 'delta'
+
+COMPACT_INDEX_SCHEMA = {
+    'doc': 'Index from a value to delta encoded haul ids in the main index.',
+    'name': 'CompactIndex',
+    'namespace': 'edu.dse.afscgap',
+    'type': 'record',
+    'fields': [
+        {'name': 'value', 'type': ['string', 'long', 'double', 'null']},
+        {'name': 'hauls', 'type': {'type': 'array', 'items': 'long'}}
+    ]
+}
+
+
+class MainIndexMismatchError(Exception):
+    pass
+
+
+def get_keys_fingerprint(haul_keys):
+    serialized = json.dumps(haul_keys, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(serialized.encode('utf-8')).hexdigest()
+
+
+def load_main_index(storage):
+    haul_keys = list(fastavro.reader(storage.get(MAIN_INDEX_LOC)))
+    return {
+        'fingerprint': get_keys_fingerprint(haul_keys),
+        'haul_keys': haul_keys
+    }
+
+
+def make_haul_ids(haul_keys):
+    return dict(map(
+        lambda x: ((x[1]['year'], x[1]['survey'], x[1]['haul']), x[0]),
+        enumerate(haul_keys)
+    ))
+
+
+def make_compact_metadata(main_fingerprint):
+    return {
+        POSTINGS_KEY: DELTA_POSTINGS,
+        MAIN_FINGERPRINT_KEY: main_fingerprint
+    }
+
+
+def is_compact(reader):
+    return reader.metadata.get(POSTINGS_KEY, None) == DELTA_POSTINGS
+
+
+def get_main_fingerprint(metadata):
+    return metadata.get(MAIN_FINGERPRINT_KEY, None)
+
+
+def check_main_fingerprint(metadata, main_index):
+    if get_main_fingerprint(metadata) != main_index['fingerprint']:
+        raise MainIndexMismatchError(
+            'Index was built against a different %s.' % MAIN_INDEX_LOC
+        )
+
+
+def encode_deltas(haul_ids):
+    haul_ids_sorted = sorted(set(haul_ids))
+    previous = itertools.chain([0], haul_ids_sorted)
+    return list(map(lambda x: x[1] - x[0], zip(previous, haul_ids_sorted)))
+
+
+def decode_deltas(deltas):
+    return list(itertools.accumulate(deltas))
+
+
+def decode_postings(deltas, haul_keys):
+    return list(map(lambda x: haul_keys[x], decode_deltas(deltas)))
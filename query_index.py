@@ -0,0 +1,79 @@
+import json
+import sys
+
+import combine_shards
+import index_sidecars
+import postings
+import storage as storage_lib
+
+NUM_ARGS = 2
+USAGE_STR = (
+    'python query_index.py [bucket] [key] [--value=x] [--min=x] [--max=x]'
+)
+
+
+def parse_options(args):
+    flags = filter(lambda x: x.startswith('--'), args)
+    pairs = map(lambda x: x[2:].split('=', 1), flags)
+    return dict(map(lambda x: (x[0], x[1] if len(x) > 1 else ''), pairs))
+
+
+def decode_records(storage, key, records):
+    if not any(map(lambda x: 'hauls' in x, records)):
+        return records
+
+    main_index = postings.load_main_index(storage)
+    postings.check_main_fingerprint(
+        index_sidecars.read_index_metadata(storage, key),
+        main_index
+    )
+    haul_keys = main_index['haul_keys']
+    return list(map(
+        lambda x: {
+            'value': x['value'],
+            'keys': postings.decode_postings(x['hauls'], haul_keys)
+        },
+        records
+    ))
+
+
+def main():
+    args = list(filter(lambda x: not x.startswith('--'), sys.argv))
+    options = parse_options(sys.argv[1:])
+
+    if len(args) != NUM_ARGS + 1:
+        print(USAGE_STR)
+        sys.exit(1)
+
+    bucket = args[1]
+    key = args[2]
+    min_value = float(options['min']) if 'min' in options else None
+    max_value = float(options['max']) if 'max' in options else None
+
+    storage = storage_lib.get_storage(bucket)
+    if 'value' in options:
+        records = index_sidecars.lookup_value(
+            storage,
+            key,
+            options['value'],
+            numeric=key in combine_shards.NUMERIC_KEYS
+        )
+    else:
+        records = index_sidecars.read_range(
+            storage,
+            key,
+            min_value,
+            max_value
+        )
+
+    try:
+        decoded = decode_records(storage, key, records)
+    except postings.MainIndexMismatchError as e:
+        print('%s Rebuild the %s index.' % (str(e), key))
+        sys.exit(1)
+
+    print(json.dumps(decoded, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+import io
+import json
+import os
+import threading
+
+import fastavro
+import fastavro.write
+
+CODEC_ENV = 'AFSCGAP_AVRO_CODEC'
+DEFAULT_CODEC = 'null'
+CODECS = ['null', 'deflate', 'snappy', 'zstandard']
+PROBE_SCHEMA = {'name': 'Probe', 'type': 'record', 'fields': []}
+
+compiled_cache = {}
+compiled_cache_lock = threading.Lock()
+codec_availability = {}
+
+
+class CompiledSchema:
+
+    def __init__(self, schema):
+        self._schema = schema
+        self._parsed = fastavro.parse_schema(schema)
+        self._field_names = tuple(map(lambda x: x['name'], schema['fields']))
+
+    def get_schema(self):
+        return self._schema
+
+    def get_parsed(self):
+        return self._parsed
+
+    def get_field_names(self):
+        return self._field_names
+
+    def project(self, record):
+        return {x: record.get(x, None) for x in self._field_names}
+
+    def write(self, target, records, metadata=None, codec=None):
+        fastavro.writer(
+            target,
+            self._parsed,
+            records,
+            codec=get_codec(codec),
+            metadata=metadata
+        )
+
+    def make_writer(self, target, metadata=None, codec=None):
+        return fastavro.write.Writer(
+            target,
+            self._parsed,
+            codec=get_codec(codec),
+            metadata=metadata
+        )
+
+    def write_projected(self, target, records, metadata=None, codec=None):
+        self.write(
+            target,
+            map(self.project, records),
+            metadata=metadata,
+            codec=codec
+        )
+
+
+def is_codec_available(codec):
+    if codec not in codec_availability:
+        try:
+            fastavro.writer(io.BytesIO(), PROBE_SCHEMA, [{}], codec=codec)
+            codec_availability[codec] = True
+        except ValueError:
+            codec_availability[codec] = False
+
+    return codec_availability[codec]
+
+
+def get_available_codecs():
+    return list(filter(is_codec_available, CODECS))
+
+
+def get_codec(codec=None):
+    if codec is None:
+        codec = os.environ.get(CODEC_ENV, DEFAULT_CODEC)
+
+    if codec not in CODECS:
+        raise ValueError('Unknown Avro codec: %s' % codec)
+
+    if not is_codec_available(codec):
+        message = 'Avro codec %s is missing its compression library.'
+        raise ValueError(message % codec)
+
+    return codec
+
+
+def compile_schema(schema):
+    cache_key = json.dumps(schema, sort_keys=True)
+
+    with compiled_cache_lock:
+        if cache_key not in compiled_cache:
+            compiled_cache[cache_key] = CompiledSchema(schema)
+
+        return compiled_cache[cache_key]
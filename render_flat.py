@@ -1,16 +1,30 @@
 import csv
-import io
 import itertools
 import functools
 import os
 import sys
+import time
 
-import boto3
-import coiled
-import fastavro
+import distributed
+import toolz.itertoolz
 
-USAGE_STR = 'python render_flat.py [bucket] [filenames]'
+import execution as execution_lib
+import joined
+import records as records_lib
+import storage as storage_lib
+
+USAGE_STR = (
+    'python render_flat.py [bucket] [filenames] [--changed=path] [--compact] '
+    '[--packed] [--incremental] [--batch-size=n] [--max-attempts=n] '
+    '[--failed=path] [--engine=coiled|local] [--workers=n]'
+)
 NUM_ARGS = 2
+DEFAULT_BATCH_SIZE = 25
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_COILED_WORKERS = 10
+MAX_COILED_WORKERS = 500
+MANIFEST_SAVE_INTERVAL = 50
+VERSION_KEYS = ['haul', 'catch', 'format']
 
 
 OBSERVATION_SCHEMA = {
@@ -62,32 +76,24 @@ OBSERVATION_SCHEMA = {
 }
 
 
-def process_haul(bucket, year, survey, haul, species_by_code):
+def process_haul(bucket, year, survey, haul, species_by_code, compact=False,
+    packed_writer=None):
 
-    import copy
     import io
-    import os
 
-    import botocore
-    import boto3
     import fastavro
 
-    access_key = os.environ['AWS_ACCESS_KEY']
-    access_secret = os.environ['AWS_ACCESS_SECRET']
+    import joined
+    import records as records_lib
+    import storage as storage_lib
 
-    s3_client = boto3.client(
-        's3',
-        aws_access_key_id=access_key,
-        aws_secret_access_key=access_secret
-    )
+    storage = storage_lib.get_storage(bucket)
+    compiled_schema = records_lib.compile_schema(OBSERVATION_SCHEMA)
 
     def get_avro(full_loc):
-        target_buffer = io.BytesIO()
         try:
-            s3_client.download_fileobj(bucket, full_loc, target_buffer)
-            target_buffer.seek(0)
-            return list(fastavro.reader(target_buffer))
-        except botocore.exceptions.ClientError:
+            return list(fastavro.reader(storage.get(full_loc)))
+        except storage_lib.MissingObjectError:
             return None
 
     def append_catch_haul(catch_record, haul_record):
@@ -105,16 +111,13 @@ def process_haul(bucket, year, survey, haul, species_by_code):
         target.update(species_record)
         return target
 
-    def complete_record(target):
-        keys = map(lambda x: x['name'], OBSERVATION_SCHEMA['fields'])
-        keys_realized = list(keys)
-        values = map(lambda x: target.get(x, None), keys_realized)
-        return dict(zip(keys_realized, values))
-
-    def convert_to_avro(records):
-        records_complete = map(complete_record, records)
+    def convert_to_avro(records, metadata=None):
         target_buffer = io.BytesIO()
-        fastavro.writer(target_buffer, OBSERVATION_SCHEMA, records_complete)
+        compiled_schema.write_projected(
+            target_buffer,
+            records,
+            metadata=metadata
+        )
         target_buffer.seek(0)
         return target_buffer
 
@@ -126,22 +129,6 @@ def process_haul(bucket, year, survey, haul, species_by_code):
         target['complete'] = True
         return target
 
-    def make_zero_record(species, haul_record):
-        haul_copy = copy.deepcopy(haul_record)
-        haul_copy['species_code'] = species['species_code']
-        haul_copy['cpue_kgkm2'] = 0
-        haul_copy['cpue_nokm2'] = 0
-        haul_copy['count'] = 0
-        haul_copy['weight_kg'] = 0
-        haul_copy['taxon_confidence'] = None
-        haul_copy['scientific_name'] = species['scientific_name']
-        haul_copy['common_name'] = species['common_name']
-        haul_copy['id_rank'] = species['id_rank']
-        haul_copy['worms'] = species['worms']
-        haul_copy['itis'] = species['itis']
-        haul_copy['complete'] = True
-        return haul_copy
-
     template_vals = (year, survey, haul)
     haul_loc = 'haul/%d_%s_%d.avro' % template_vals
     haul_records = get_avro(haul_loc)
@@ -162,33 +149,108 @@ def process_haul(bucket, year, survey, haul, species_by_code):
         catch_records_out = map(mark_complete, catch_with_species)
 
     catch_records_out_realized = list(catch_records_out)
-    species_codes_found = set(map(
-        lambda x: x.get('species_code', None),
-        catch_records_out_realized
-    ))
-    species_codes_all = set(species_by_code.keys())
-    speices_codes_missing = species_codes_all - species_codes_found
-    speices_missing = map(lambda x: species_by_code[x], speices_codes_missing)
-    catch_records_zero = map(
-        lambda x: make_zero_record(x, haul_record),
-        speices_missing
-    )
 
-    catch_records_all = itertools.chain(
-        catch_records_out_realized,
-        catch_records_zero
-    )
-    catch_with_species_avro = convert_to_avro(catch_records_all)
+    def get_all_records():
+        catch_records_zero = joined.make_zero_records(
+            haul_record,
+            catch_records_out_realized,
+            species_by_code
+        )
+        return itertools.chain(catch_records_out_realized, catch_records_zero)
+
+    if packed_writer is not None:
+        output_loc = packed_writer(haul, get_all_records())
+    else:
+        if compact:
+            catch_with_species_avro = convert_to_avro(
+                catch_records_out_realized,
+                metadata=joined.make_compact_metadata(haul_record)
+            )
+        else:
+            catch_with_species_avro = convert_to_avro(get_all_records())
+
+        output_loc = 'joined/%d_%s_%d.avro' % template_vals
+        storage.put(output_loc, catch_with_species_avro)
+
+    return get_output_stats(catch_records_out_realized, output_loc)
+
+
+def patch_haul(bucket, year, survey, haul, species_by_code, observed,
+    compact=False):
+
+    import io
+    import json
+
+    import fastavro
+
+    import joined
+    import records as records_lib
+    import storage as storage_lib
+
+    storage = storage_lib.get_storage(bucket)
+    compiled_schema = records_lib.compile_schema(OBSERVATION_SCHEMA)
+
+    template_vals = (year, survey, haul)
     output_loc = 'joined/%d_%s_%d.avro' % template_vals
-    s3_client.upload_fileobj(catch_with_species_avro, bucket, output_loc)
 
+    try:
+        reader = fastavro.reader(storage.get(output_loc))
+        records = list(reader)
+    except storage_lib.MissingObjectError:
+        records = []
+
+    if len(records) == 0:
+        return process_haul(
+            bucket,
+            year,
+            survey,
+            haul,
+            species_by_code,
+            compact=compact
+        )
+
+    def refresh_species(target):
+        species_record = species_by_code.get(target['species_code'], {})
+        for field in joined.SPECIES_FIELDS:
+            if field != 'species_code':
+                target[field] = species_record.get(field, None)
+        return target
+
+    observed_records = list(map(refresh_species, records[:observed]))
+
+    if compact:
+        haul_record = json.loads(reader.metadata[joined.HAUL_KEY])
+        metadata = joined.make_compact_metadata(haul_record)
+        records_all = observed_records
+    else:
+        metadata = None
+        zero_records = joined.make_zero_records(
+            records[0],
+            observed_records,
+            species_by_code
+        )
+        records_all = itertools.chain(observed_records, zero_records)
+
+    target_buffer = io.BytesIO()
+    compiled_schema.write_projected(
+        target_buffer,
+        records_all,
+        metadata=metadata
+    )
+    target_buffer.seek(0)
+    storage.put(output_loc, target_buffer)
+
+    return get_output_stats(observed_records, output_loc)
+
+
+def get_output_stats(records, output_loc):
     outputs_dicts = map(
         lambda x: {
             'complete': 1 if x['complete'] else 0,
             'incomplete': 0 if x['complete'] else 1,
             'zero': 1 if x.get('count', 0) == 0 else 0
         },
-        catch_records_out_realized
+        records
     )
     output_dict = functools.reduce(
         lambda a, b: {
@@ -202,15 +264,128 @@ def process_haul(bucket, year, survey, haul, species_by_code):
     return output_dict
 
 
-def get_hauls_meta(bucket):
-    access_key = os.environ['AWS_ACCESS_KEY']
-    access_secret = os.environ['AWS_ACCESS_SECRET']
+def process_haul_batch(bucket, hauls_meta, species_by_code, compact=False):
+    written = []
+    failed = []
+
+    for haul_meta in hauls_meta:
+        try:
+            if 'observed' in haul_meta:
+                stats = patch_haul(
+                    bucket,
+                    haul_meta['year'],
+                    haul_meta['survey'],
+                    haul_meta['haul'],
+                    species_by_code,
+                    haul_meta['observed'],
+                    compact=compact
+                )
+            else:
+                stats = process_haul(
+                    bucket,
+                    haul_meta['year'],
+                    haul_meta['survey'],
+                    haul_meta['haul'],
+                    species_by_code,
+                    compact=compact
+                )
+            written.append({'meta': haul_meta, 'stats': stats})
+        except Exception as e:
+            failed.append({'meta': haul_meta, 'error': repr(e)})
+
+    return {'written': written, 'failed': failed}
+
+
+def process_packed_group(bucket, hauls_meta, species_by_code):
 
-    s3_client = boto3.client(
-        's3',
-        aws_access_key_id=access_key,
-        aws_secret_access_key=access_secret
+    import io
+
+    import joined
+    import records as records_lib
+    import storage as storage_lib
+
+    storage = storage_lib.get_storage(bucket)
+    compiled_schema = records_lib.compile_schema(OBSERVATION_SCHEMA)
+    index_schema = records_lib.compile_schema(joined.PACKED_INDEX_SCHEMA)
+
+    year = hauls_meta[0]['year']
+    survey = hauls_meta[0]['survey']
+    packed_loc = joined.get_packed_loc(year, survey)
+
+    target_buffer = io.BytesIO()
+    writer = compiled_schema.make_writer(target_buffer)
+    writer.flush()
+    header_size = target_buffer.tell()
+    index_records = []
+
+    def write_haul(haul, records):
+        records_projected = list(map(compiled_schema.project, records))
+        start = target_buffer.tell()
+        for record in records_projected:
+            writer.write(record)
+        writer.flush()
+        index_records.append({
+            'year': year,
+            'survey': survey,
+            'haul': haul,
+            'start': start,
+            'end': target_buffer.tell()
+        })
+        return packed_loc
+
+    written = []
+    failed = []
+
+    for haul_meta in hauls_meta:
+        try:
+            stats = process_haul(
+                bucket,
+                year,
+                survey,
+                haul_meta['haul'],
+                species_by_code,
+                packed_writer=write_haul
+            )
+            written.append({'meta': haul_meta, 'stats': stats})
+        except Exception as e:
+            failed.append({'meta': haul_meta, 'error': repr(e)})
+
+    if len(failed) > 0:
+        failed_hauls = set(map(lambda x: x['meta']['haul'], failed))
+        hauls_skipped = filter(
+            lambda x: x['haul'] not in failed_hauls,
+            hauls_meta
+        )
+        failed.extend(map(
+            lambda x: {'meta': x, 'error': 'Packed group incomplete.'},
+            hauls_skipped
+        ))
+        return {'written': [], 'failed': failed}
+
+    target_buffer.seek(0)
+    storage.put(packed_loc, target_buffer)
+
+    index_buffer = io.BytesIO()
+    index_schema.write(
+        index_buffer,
+        index_records,
+        metadata={joined.HEADER_SIZE_KEY: str(header_size)}
     )
+    index_buffer.seek(0)
+    storage.put(joined.get_packed_index_loc(year, survey), index_buffer)
+
+    return {'written': written, 'failed': []}
+
+
+def get_packed_groups(hauls_meta):
+    get_group_key = lambda x: (x['year'], x['survey'])
+    hauls_meta_sorted = sorted(hauls_meta, key=get_group_key)
+    groups = itertools.groupby(hauls_meta_sorted, key=get_group_key)
+    return [list(x[1]) for x in groups]
+
+
+def get_hauls_meta(bucket):
+    storage = storage_lib.get_storage(bucket)
 
     def make_haul_metadata_record(path):
         filename_with_path = path.split('/')[-1]
@@ -223,82 +398,229 @@ def get_hauls_meta(bucket):
             'haul': int(components[2])
         }
 
-    paginator = s3_client.get_paginator('list_objects_v2')
-    iterator = paginator.paginate(Bucket=bucket, Prefix='haul/')
-    pages = filter(lambda x: 'Contents' in x, iterator)
-    contents = map(lambda x: x['Contents'], pages)
-    contents_flat = itertools.chain(*contents)
-    keys = map(lambda x: x['Key'], contents_flat)
+    keys = storage.list('haul/')
     return map(make_haul_metadata_record, keys)
 
 
 def get_all_species(bucket):
-    access_key = os.environ['AWS_ACCESS_KEY']
-    access_secret = os.environ['AWS_ACCESS_SECRET']
+    storage = storage_lib.get_storage(bucket)
+    return joined.load_species(storage)
 
-    s3_client = boto3.client(
-        's3',
-        aws_access_key_id=access_key,
-        aws_secret_access_key=access_secret
-    )
 
-    def get_avro(full_loc):
-        target_buffer = io.BytesIO()
-        s3_client.download_fileobj(bucket, full_loc, target_buffer)
-        target_buffer.seek(0)
-        return list(fastavro.reader(target_buffer))
+def load_changed_hauls(changed_loc):
+    with open(changed_loc) as f:
+        locs = [x.strip() for x in f if x.strip() != '']
 
-    paginator = s3_client.get_paginator('list_objects_v2')
-    iterator = paginator.paginate(Bucket=bucket, Prefix='species/')
-    pages = filter(lambda x: 'Contents' in x, iterator)
-    contents = map(lambda x: x['Contents'], pages)
-    contents_flat = itertools.chain(*contents)
-    keys = map(lambda x: x['Key'], contents_flat)
-    records_nest = map(get_avro, keys)
-    records_flat = itertools.chain(*records_nest)
-    records_tuples = map(lambda x: (x['species_code'], x), records_flat)
-    return dict(records_tuples)
+    if any(map(lambda x: x.startswith('species/'), locs)):
+        return None
+
+    def get_hauljoin(loc):
+        filename_with_path = loc.split('/')[-1]
+        filename = filename_with_path.split('.')[0]
+        return int(filename.split('_')[-1])
+
+    return set(map(get_hauljoin, locs))
+
+
+def select_hauls(hauls_meta, is_selected, packed):
+    hauls_meta_realized = list(hauls_meta)
+
+    if packed:
+        selected_groups = set(map(
+            lambda x: (x['year'], x['survey']),
+            filter(is_selected, hauls_meta_realized)
+        ))
+        return filter(
+            lambda x: (x['year'], x['survey']) in selected_groups,
+            hauls_meta_realized
+        )
+    else:
+        return filter(is_selected, hauls_meta_realized)
+
+
+def get_output_format(compact, packed):
+    if packed:
+        return 'packed'
+    elif compact:
+        return 'compact'
+    else:
+        return 'full'
+
+
+def make_version_getter(bucket, species_by_code, output_format):
+    storage = storage_lib.get_storage(bucket)
+    haul_versions = dict(storage.list_versions('haul/'))
+    catch_versions = dict(storage.list_versions('catch/'))
+    catalog_version = joined.get_catalog_version(species_by_code)
+
+    def get_versions(haul_meta):
+        catch_loc = 'catch/%d.avro' % haul_meta['haul']
+        return {
+            'haul': haul_versions.get(haul_meta['path'], None),
+            'catch': catch_versions.get(catch_loc, None),
+            'catalog': catalog_version,
+            'format': output_format
+        }
+
+    return get_versions
+
+
+def get_num_observed(stats):
+    return stats['complete'] + stats['incomplete']
+
+
+def plan_haul(entry, versions):
+    if entry is None:
+        return 'render'
+
+    inputs_changed = map(lambda x: entry.get(x) != versions[x], VERSION_KEYS)
+    if any(inputs_changed):
+        return 'render'
+    elif entry['catalog'] != versions['catalog']:
+        return 'patch'
+    else:
+        return None
+
+
+def parse_options(args):
+    flags = filter(lambda x: x.startswith('--'), args)
+    pairs = map(lambda x: x[2:].split('=', 1), flags)
+    return dict(map(lambda x: (x[0], x[1] if len(x) > 1 else ''), pairs))
 
 
 def main():
-    if len(sys.argv) != NUM_ARGS + 1:
+    args = list(filter(lambda x: not x.startswith('--'), sys.argv))
+    options = parse_options(sys.argv[1:])
+
+    if len(args) != NUM_ARGS + 1:
         print(USAGE_STR)
         sys.exit(1)
 
-    bucket = sys.argv[1]
-    file_paths_loc = sys.argv[2]
+    compact = 'compact' in options
+    packed = 'packed' in options
+    incremental = 'incremental' in options
+
+    if compact and packed:
+        print('The --compact and --packed options cannot be combined.')
+        sys.exit(1)
+
+    bucket = args[1]
+    file_paths_loc = args[2]
     hauls_meta = get_hauls_meta(bucket)
 
-    cluster = coiled.Cluster(
-        name='DseProcessAfscgap',
-        n_workers=10,
-        worker_vm_types=['m7a.medium'],
-        scheduler_vm_types=['m7a.medium'],
-        environ={
+    if 'changed' in options:
+        changed_hauls = load_changed_hauls(options['changed'])
+    else:
+        changed_hauls = None
+
+    if changed_hauls is not None:
+        hauls_meta = select_hauls(
+            hauls_meta,
+            lambda x: x['haul'] in changed_hauls,
+            packed
+        )
+
+    species_by_code = get_all_species(bucket)
+
+    if incremental:
+        storage = storage_lib.get_storage(bucket)
+        manifest = joined.load_render_manifest(storage)
+        get_versions = make_version_getter(
+            bucket,
+            species_by_code,
+            get_output_format(compact, packed)
+        )
+
+        hauls_meta = list(hauls_meta)
+        actions = dict(map(
+            lambda x: (
+                x['path'],
+                plan_haul(manifest.get(x['path'], None), get_versions(x))
+            ),
+            hauls_meta
+        ))
+        hauls_meta_stale = select_hauls(
+            hauls_meta,
+            lambda x: actions[x['path']] is not None,
+            packed
+        )
+
+        def add_action(haul_meta):
+            if not packed and actions[haul_meta['path']] == 'patch':
+                observed = manifest[haul_meta['path']]['observed']
+                return dict(haul_meta, observed=observed)
+            else:
+                return haul_meta
+
+        hauls_meta = list(map(add_action, hauls_meta_stale))
+        num_patched = len(list(filter(lambda x: 'observed' in x, hauls_meta)))
+        template_vals = (len(hauls_meta) - num_patched, num_patched)
+        print('Incremental: %d to render, %d to patch.' % template_vals)
+
+    engine = options.get('engine', execution_lib.DEFAULT_ENGINE)
+    execution = execution_lib.start_cluster(
+        engine,
+        execution_lib.get_n_workers(options, engine, DEFAULT_COILED_WORKERS),
+        {
             'AWS_ACCESS_KEY': os.environ.get('AWS_ACCESS_KEY', ''),
             'AWS_ACCESS_SECRET': os.environ.get('AWS_ACCESS_SECRET', ''),
+            records_lib.CODEC_ENV: records_lib.get_codec(),
             'SOURCE_DATA_LOC': os.environ.get('SOURCE_DATA_LOC', '')
-        }
+        },
+        adapt_maximum=MAX_COILED_WORKERS
     )
-    cluster.adapt(minimum=10, maximum=500)
-    client = cluster.get_client()
-
-    hauls_meta_realized = list(hauls_meta)
-    species_by_code = get_all_species(bucket)
+    client = execution['client']
 
-    written_paths_future = client.map(
-        lambda x: process_haul(
+    batch_size = int(options.get('batch-size', DEFAULT_BATCH_SIZE))
+    if packed:
+        hauls_meta_batched = get_packed_groups(hauls_meta)
+    else:
+        hauls_meta_batched = list(toolz.itertoolz.partition_all(
+            batch_size,
+            hauls_meta
+        ))
+
+    species_future = client.scatter([species_by_code], broadcast=True)[0]
+    max_attempts = int(options.get('max-attempts', DEFAULT_MAX_ATTEMPTS))
+
+    def submit_batch(batch):
+        if packed:
+            return client.submit(
+                process_packed_group,
+                bucket,
+                batch,
+                species_future,
+                pure=False
+            )
+
+        return client.submit(
+            process_haul_batch,
             bucket,
-            x['year'],
-            x['survey'],
-            x['haul'],
-            species_by_code
-        ),
-        hauls_meta_realized
-    )
-    written_paths = map(lambda x: x.result(), written_paths_future)
+            batch,
+            species_future,
+            compact=compact,
+            pure=False
+        )
+
+    attempts_by_future = {}
+    batch_by_future = {}
+
+    def track(future, batch, attempt):
+        attempts_by_future[future] = attempt
+        batch_by_future[future] = batch
+        return future
 
-    with open(file_paths_loc, 'w') as f:
+    futures = [track(submit_batch(x), x, 1) for x in hauls_meta_batched]
+    futures_completed = distributed.as_completed(futures)
+
+    failed_loc = options.get('failed', file_paths_loc + '.failed.csv')
+    num_hauls = sum(map(len, hauls_meta_batched))
+    num_done = 0
+    num_failed = 0
+    num_batches_done = 0
+    start = time.monotonic()
+
+    with open(file_paths_loc, 'w') as f, open(failed_loc, 'w') as f_failed:
         writer = csv.DictWriter(f, fieldnames=[
             'loc',
             'complete',
@@ -306,9 +628,80 @@ def main():
             'zero'
         ])
         writer.writeheader()
-        writer.writerows(written_paths)
 
-    cluster.close(force_shutdown=True)
+        failed_writer = csv.DictWriter(f_failed, fieldnames=[
+            'year',
+            'survey',
+            'haul',
+            'error'
+        ])
+        failed_writer.writeheader()
+
+        for future in futures_completed:
+            attempt = attempts_by_future.pop(future)
+            batch = batch_by_future.pop(future)
+
+            if future.status == 'error':
+                error = repr(future.exception())
+                failed = [{'meta': x, 'error': error} for x in batch]
+                written = []
+            elif future.status != 'finished':
+                error = 'Batch %s.' % future.status
+                failed = [{'meta': x, 'error': error} for x in batch]
+                written = []
+            else:
+                result = future.result()
+                failed = result['failed']
+                written = result['written']
+
+            writer.writerows(map(lambda x: x['stats'], written))
+            f.flush()
+            num_done += len(written)
+            num_batches_done += 1
+
+            if incremental:
+                manifest.update(map(
+                    lambda x: (x['meta']['path'], dict(
+                        get_versions(x['meta']),
+                        observed=get_num_observed(x['stats'])
+                    )),
+                    written
+                ))
+
+                if num_batches_done % MANIFEST_SAVE_INTERVAL == 0:
+                    joined.save_render_manifest(storage, manifest)
+
+            if len(failed) > 0 and attempt < max_attempts:
+                retry_batch = [x['meta'] for x in failed]
+                retry_future = submit_batch(retry_batch)
+                track(retry_future, retry_batch, attempt + 1)
+                futures_completed.add(retry_future)
+            elif len(failed) > 0:
+                failed_writer.writerows(map(
+                    lambda x: {
+                        'year': x['meta']['year'],
+                        'survey': x['meta']['survey'],
+                        'haul': x['meta']['haul'],
+                        'error': x['error']
+                    },
+                    failed
+                ))
+                f_failed.flush()
+                num_failed += len(failed)
+
+            duration = time.monotonic() - start
+            template_vals = (
+                num_done,
+                num_failed,
+                num_hauls,
+                num_done / max(duration, 1)
+            )
+            print('%d written, %d failed of %d (%.1f hauls/s)' % template_vals)
+
+    if incremental:
+        joined.save_render_manifest(storage, manifest)
+
+    execution_lib.stop_cluster(execution)
 
 
 if __name__ == '__main__':
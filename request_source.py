@@ -1,18 +1,41 @@
+import collections
+import concurrent.futures
+import hashlib
+import heapq
 import io
 import itertools
+import json
 import os
+import shutil
 import sys
+import tempfile
+import threading
 import time
 
-import boto3
 import fastavro
-import requests
 import toolz.itertoolz
 
+import foss_client as foss_client_lib
+import joined
+import records as records_lib
+import storage as storage_lib
+
 MIN_ARGS = 3
 MAX_ARGS = 4
-USAGE_STR = 'python request_source.py [type] [bucket] [location] [year]'
-DOMAIN = 'https://apps-st.fisheries.noaa.gov'
+USAGE_STR = (
+    'python request_source.py [type] [bucket] [location] [year] '
+    '[--concurrency=n] [--buffered] [--buffer-records=n] [--staging=dir] '
+    '[--checkpoint=path] [--resume] [--domain=url] [--max-page-size=n] '
+    '[--max-retries=n] [--partitions=n] [--workers=n] [--jobs=n] '
+    '[--delta] [--changed=path]'
+)
+REPORT_SECONDS = 30
+DEFAULT_CONCURRENCY = 4
+DEFAULT_WORKERS = 32
+DEFAULT_BUFFER_RECORDS = 500000
+CHECKPOINT_INTERVAL = 1000
+DEFAULT_JOBS = 16
+DEFAULT_CHANGED_PATH = 'changed.txt'
 ENDPOINTS = {
     'haul': '/ods/foss/afsc_groundfish_survey_haul/',
     'catch': '/ods/foss/afsc_groundfish_survey_catch/',
@@ -92,104 +115,763 @@ SCHEMAS = {
     'species': SPECIES_SCHEMA
 }
 
+PARTITION_KEYS = {
+    'haul': 'hauljoin',
+    'catch': 'hauljoin',
+    'species': 'species_code'
+}
 
-def dump_to_s3(year, bucket, loc, type_name):
-    offset = 0
-    done = False
+ORDER_KEYS = {
+    'haul': ['hauljoin'],
+    'catch': ['hauljoin', 'species_code'],
+    'species': ['species_code']
+}
+
+
+class Progress:
+
+    def __init__(self, report_interval=REPORT_SECONDS):
+        self._report_interval = report_interval
+        self._start = time.monotonic()
+        self._last_report = self._start
+        self._offsets = {}
+        self._rows = 0
+        self._finished = set()
+        self._lock = threading.Lock()
+
+    def start(self, label, offset):
+        with self._lock:
+            self._offsets[label] = offset
+
+    def record_page(self, label, offset, count):
+        with self._lock:
+            self._offsets[label] = offset
+            self._rows += count
+
+            now = time.monotonic()
+            if now - self._last_report >= self._report_interval:
+                self._last_report = now
+                self._print_report(now)
+
+    def finish(self, label):
+        with self._lock:
+            self._finished.add(label)
+            self._print_report(time.monotonic())
+
+    def _print_report(self, now):
+        active = filter(lambda x: x not in self._finished, self._offsets)
+        active_strs = map(lambda x: '%s@%d' % (x, self._offsets[x]), active)
+        rows_per_second = self._rows / max(now - self._start, 1)
+        template_vals = (
+            len(self._finished),
+            len(self._offsets),
+            self._rows,
+            rows_per_second,
+            ' '.join(active_strs)
+        )
+        print('[%d/%d done] %d rows (%.0f/s) %s' % template_vals)
+
+
+class Manifest:
+
+    def __init__(self, storage, loc):
+        self._storage = storage
+        self._manifest_loc = 'manifest/%s.json' % loc.replace('/', '_')
+        self._changed = set()
+        self._lock = threading.Lock()
+
+        try:
+            target_buffer = storage.get(self._manifest_loc)
+            self._hashes = json.loads(target_buffer.read())
+        except storage_lib.MissingObjectError:
+            self._hashes = {}
+
+    def get_hash(self, object_loc):
+        with self._lock:
+            return self._hashes.get(object_loc, None)
+
+    def update(self, hashes):
+        with self._lock:
+            self._hashes.update(hashes)
+            self._changed.update(hashes.keys())
+
+    def save(self):
+        with self._lock:
+            target_buffer = io.BytesIO()
+            target_buffer.write(json.dumps(self._hashes).encode('utf-8'))
+            target_buffer.seek(0)
+            self._storage.put(self._manifest_loc, target_buffer)
+
+    def get_changed(self):
+        with self._lock:
+            return sorted(self._changed)
+
+
+def get_record_order(type_name):
+    key_names = ORDER_KEYS[type_name]
+    return lambda x: tuple(map(lambda y: x[y], key_names))
+
+
+def hash_records(records):
+    serialized = json.dumps(records, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(serialized.encode('utf-8')).hexdigest()
+
+
+def write_changed(changed_path, manifests):
+    changed_nest = map(lambda x: x.get_changed(), manifests)
+    changed = sorted(itertools.chain(*changed_nest))
+    with open(changed_path, 'w') as f:
+        f.write(''.join(map(lambda x: x + '\n', changed)))
+
+    print('Wrote %d changed objects to %s.' % (len(changed), changed_path))
+
+
+def make_foss_client(options, pool_size):
+    max_page_size = int(options.get(
+        'max-page-size',
+        foss_client_lib.DEFAULT_MAX_PAGE_SIZE
+    ))
+    return foss_client_lib.FossClient(
+        pool_size=pool_size,
+        domain=options.get('domain', foss_client_lib.DEFAULT_DOMAIN),
+        page_sizer=foss_client_lib.PageSizer(
+            initial_size=max_page_size,
+            max_size=max_page_size
+        ),
+        max_retries=int(options.get(
+            'max-retries',
+            foss_client_lib.DEFAULT_MAX_RETRIES
+        ))
+    )
+
+
+def write_species_catalog(storage, loc):
+    locs = storage.list(loc + '/')
+    buffers = storage_lib.get_all(storage, locs)
+    records_nest = map(fastavro.reader, buffers)
+    records_flat = itertools.chain(*records_nest)
+    records_by_code = dict(map(lambda x: (x['species_code'], x), records_flat))
+    sorted_codes = sorted(records_by_code.keys())
+    records_sorted = map(lambda x: records_by_code[x], sorted_codes)
+
+    target_buffer = io.BytesIO()
+    records_lib.compile_schema(SPECIES_SCHEMA).write(
+        target_buffer,
+        records_sorted
+    )
+    target_buffer.seek(0)
+    storage.put(joined.SPECIES_CATALOG_LOC, target_buffer)
+    print('Wrote %d species to catalog.' % len(sorted_codes))
+
+
+def get_label(type_name, year, partition):
+    pieces = [type_name]
+
+    if year is not None:
+        pieces.append(str(year))
+
+    if partition is not None:
+        pieces.append('p%d_%d' % tuple(partition))
+
+    return '_'.join(pieces)
+
+
+def get_default_checkpoint_path(year, loc, type_name, partition=None):
+    loc_name = loc.replace('/', '_')
+    year_name = 'all' if year is None else str(year)
+    template_vals = (type_name, loc_name, year_name)
+    base_name = '%s_%s_%s' % template_vals
+
+    if partition is not None:
+        base_name += '_p%d_%d' % tuple(partition)
+
+    return base_name + '.checkpoint.json'
+
+
+def get_default_partitions_path(year, loc, type_name):
+    loc_name = loc.replace('/', '_')
+    year_name = 'all' if year is None else str(year)
+    template_vals = (type_name, loc_name, year_name)
+    return '%s_%s_%s.partitions.json' % template_vals
+
+
+def get_key_bound(foss_client, type_name, direction):
     endpoint = ENDPOINTS[type_name]
+    key_name = PARTITION_KEYS[type_name]
+    query = {'$orderby': {key_name: direction}}
+    page = foss_client.get_page(endpoint, 0, 1, query)
+    return page['items'][0][key_name]
+
+
+def get_partitions(foss_client, type_name, num_partitions):
+    min_key = get_key_bound(foss_client, type_name, 'asc')
+    max_key = get_key_bound(foss_client, type_name, 'desc')
+    span = max_key - min_key + 1
+    num_partitions = min(num_partitions, span)
+
+    starts = map(
+        lambda x: min_key + span * x // num_partitions,
+        range(num_partitions + 1)
+    )
+    starts_realized = list(starts)
+    return [
+        (starts_realized[i], starts_realized[i + 1] - 1)
+        for i in range(num_partitions)
+    ]
+
+
+def load_checkpoint(checkpoint_path):
+    if not os.path.exists(checkpoint_path):
+        return None
+
+    with open(checkpoint_path) as f:
+        return json.load(f)
+
+
+def load_partitions(partitions_path, num_partitions):
+    saved = load_checkpoint(partitions_path)
+    if saved is None:
+        return None
+
+    if saved['num_partitions'] != num_partitions:
+        raise RuntimeError('Saved partitions do not match requested dump.')
+
+    return list(map(tuple, saved['partitions']))
+
+
+def save_checkpoint(checkpoint_path, state):
+    temp_path = checkpoint_path + '.tmp'
+    with open(temp_path, 'w') as f:
+        json.dump(state, f)
+        f.flush()
+        os.fsync(f.fileno())
+
+    os.replace(temp_path, checkpoint_path)
+
 
-    s3_client = boto3.client(
-        's3',
-        aws_access_key_id=os.environ['AWS_ACCESS_KEY'],
-        aws_secret_access_key=os.environ['AWS_ACCESS_SECRET']
+def get_journal_path(checkpoint_path):
+    return checkpoint_path + '.journal'
+
+
+def load_journal(journal_path, offset):
+    if not os.path.exists(journal_path):
+        return []
+
+    with open(journal_path) as f:
+        lines = f.read().split('\n')[:-1]
+
+    entries = map(lambda x: x.split('\t'), lines)
+    entries_valid = filter(lambda x: len(x) == 3, entries)
+    entries_parsed = map(
+        lambda x: {'offset': int(x[0]), 'limit': int(x[1]), 'loc': x[2]},
+        entries_valid
     )
+    return list(filter(lambda x: x['offset'] == offset, entries_parsed))
+
+
+def dump_to_s3(year, bucket, loc, type_name, concurrency=1, buffered=False,
+    buffer_records=DEFAULT_BUFFER_RECORDS, staging_dir=None,
+    checkpoint_path=None, resume=False, foss_client=None, storage=None,
+    executor=None, progress=None, partition=None, manifest=None,
+    keep_checkpoint=False):
+    done = False
+    endpoint = ENDPOINTS[type_name]
+    buffer_by_loc = {}
+    buffer_count = 0
+
+    if foss_client is None:
+        foss_client = foss_client_lib.FossClient()
+
+    if storage is None:
+        storage = storage_lib.get_storage(bucket)
+
+    if progress is None:
+        progress = Progress()
+
+    label = get_label(type_name, year, partition)
+
+    if checkpoint_path is None:
+        checkpoint_path = get_default_checkpoint_path(
+            year,
+            loc,
+            type_name,
+            partition
+        )
+
+    scope = {
+        'year': year,
+        'bucket': bucket,
+        'loc': loc,
+        'type': type_name,
+        'buffered': buffered,
+        'partition': None if partition is None else list(partition),
+        'delta': manifest is not None
+    }
+
+    prior_state = load_checkpoint(checkpoint_path) if resume else None
+    if prior_state is None:
+        remove_staging = buffered and staging_dir is None
+        if remove_staging:
+            staging_dir = tempfile.mkdtemp(prefix='afscgap_staging_')
+
+        state = {
+            'scope': scope,
+            'offset': 0,
+            'fetched': False,
+            'segments': [],
+            'flushed_through': None,
+            'manifest_updates': {},
+            'staging': staging_dir,
+            'remove_staging': remove_staging
+        }
+    else:
+        if prior_state['scope'] != scope:
+            raise RuntimeError('Checkpoint does not match requested dump.')
+
+        state = prior_state
+
+        if state.get('complete', False):
+            print('Skipping %s, already complete.' % label)
+            if manifest is not None:
+                manifest.update(state['manifest_updates'])
+            return
+
+        staging_dir = state['staging']
+        print('Resuming from offset %d...' % state['offset'])
+
+    if buffered:
+        os.makedirs(staging_dir, exist_ok=True)
+
+    offset = state['offset']
+    segment_paths = state['segments']
+
+    journal_path = get_journal_path(checkpoint_path)
+    if prior_state is None:
+        journal_entries = []
+    else:
+        journal_entries = load_journal(journal_path, offset)
+
+    page_written = set(map(lambda x: x['loc'], journal_entries))
+    if len(journal_entries) > 0:
+        resume_limit = journal_entries[0]['limit']
+    else:
+        resume_limit = None
+
+    journal = open(journal_path, 'w' if prior_state is None else 'a')
+    page_limit = None
+
+    compiled_schema = records_lib.compile_schema(SCHEMAS[type_name])
+    record_order = get_record_order(type_name)
 
     def convert_to_avro(records):
         target_buffer = io.BytesIO()
-        fastavro.writer(target_buffer, SCHEMAS[type_name], records)
+        compiled_schema.write(target_buffer, records)
         target_buffer.seek(0)
         return target_buffer
 
-    def append_in_bucket(key, records):
-        sample_record = records[0]
-
+    def get_location(record):
         if type_name == 'haul':
             template_vals = (
                 year,
-                sample_record['survey'],
-                sample_record['hauljoin']
+                record['survey'],
+                record['hauljoin']
             )
-            full_loc = loc + '/%d_%s_%d.avro' % template_vals
+            return loc + '/%d_%s_%d.avro' % template_vals
         elif type_name == 'catch':
-            full_loc = loc + '/%d.avro' % sample_record['hauljoin']
+            return loc + '/%d.avro' % record['hauljoin']
         elif type_name == 'species':
-            full_loc = loc + '/%d.avro' % sample_record['species_code']
+            return loc + '/%d.avro' % record['species_code']
+
+    def append_in_bucket(key, records):
+        full_loc = get_location(records[0])
+
+        if full_loc in page_written:
+            return
 
         try:
-            target_buffer = io.BytesIO()
-            s3_client.download_fileobj(bucket, full_loc, target_buffer)
-            target_buffer.seek(0)
-            prior_records = fastavro.reader(target_buffer)
-        except s3_client.exceptions.ClientError:
+            prior_records = fastavro.reader(storage.get(full_loc))
+        except storage_lib.MissingObjectError:
             prior_records = []
 
         records_avro = convert_to_avro(itertools.chain(prior_records, records))
-        s3_client.upload_fileobj(records_avro, bucket, full_loc)
+        storage.put(full_loc, records_avro)
+
+        page_written.add(full_loc)
+        journal.write('%d\t%d\t%s\n' % (offset, page_limit, full_loc))
+        journal.flush()
+
+    def get_buffered_records():
+        sorted_locs = sorted(buffer_by_loc.keys())
+        records_nest = map(lambda x: buffer_by_loc[x], sorted_locs)
+        return itertools.chain(*records_nest)
+
+    def spill_buffer():
+        nonlocal buffer_count
+        segment_loc = os.path.join(
+            staging_dir,
+            'segment_%d.avro' % len(segment_paths)
+        )
+        temp_loc = segment_loc + '.tmp'
+        records = get_buffered_records()
+        with open(temp_loc, 'wb') as f:
+            compiled_schema.write(f, records)
+            f.flush()
+            os.fsync(f.fileno())
+
+        os.replace(temp_loc, segment_loc)
+        segment_paths.append(segment_loc)
+        buffer_by_loc.clear()
+        buffer_count = 0
+
+    def read_segment(segment_loc):
+        with open(segment_loc, 'rb') as f:
+            yield from fastavro.reader(f)
+
+    def buffer_in_memory(key, records):
+        nonlocal buffer_count
+        full_loc = get_location(records[0])
+        buffer_by_loc.setdefault(full_loc, []).extend(records)
+        buffer_count += len(records)
+
+    def flush_buffer():
+        segments = map(read_segment, segment_paths)
+        merged = heapq.merge(*segments, key=get_location)
+        by_loc = itertools.groupby(merged, key=get_location)
+
+        flushed_through = state['flushed_through']
+        if flushed_through is not None:
+            by_loc = filter(lambda x: x[0] > flushed_through, by_loc)
+
+        for i, (full_loc, records) in enumerate(by_loc):
+            records_realized = sorted(records, key=record_order)
 
-    def write_response(parsed):
-        items = parsed['items']
+            if manifest is None:
+                changed = True
+            else:
+                content_hash = hash_records(records_realized)
+                changed = manifest.get_hash(full_loc) != content_hash
+
+            if changed:
+                records_avro = convert_to_avro(records_realized)
+                storage.put(full_loc, records_avro)
+
+            if changed and manifest is not None:
+                state['manifest_updates'][full_loc] = content_hash
+
+            state['flushed_through'] = full_loc
+            if (i + 1) % CHECKPOINT_INTERVAL == 0:
+                save_checkpoint(checkpoint_path, state)
+
+        save_checkpoint(checkpoint_path, state)
+
+    def group_items(items):
         key_name = 'species_code' if type_name == 'species' else 'hauljoin'
-        by_key = toolz.itertoolz.groupby(lambda x: x[key_name], items)
+        return toolz.itertoolz.groupby(lambda x: x[key_name], items)
+
+    def write_response(by_key):
+        write_records = buffer_in_memory if buffered else append_in_bucket
         for key_tuple in by_key.items():
             key = key_tuple[0]
             records = key_tuple[1]
-            append_in_bucket(key, records)
+            write_records(key, records)
 
-    def execute_request(offset):
-        if year:
-            params = '?offset=%d&limit=10000&q={"year":%d}' % (offset, year)
+    def commit_page():
+        page_written.clear()
+        state['offset'] = offset
+
+        if buffered:
+            if buffer_count > buffer_records or done:
+                spill_buffer()
+                state['segments'] = segment_paths
+                state['fetched'] = done
+                save_checkpoint(checkpoint_path, state)
         else:
-            params = '?offset=%d&limit=10000' % offset
-
-        full_url = DOMAIN + endpoint + params
-        response = requests.get(full_url)
-        return response
-
-    while not done:
-        if offset % 100000 == 0:
-            print('Offset: %d' % offset)
-
-        response = execute_request(offset)
-        status_code = response.status_code
-
-        if status_code == 200:
-            parsed = response.json()
-            write_response(parsed)
-            offset += 10000
-            done = len(parsed['items']) == 0
-            if done:
-                print('Ending gracefully...')
+            os.fsync(journal.fileno())
+            state['fetched'] = done
+            save_checkpoint(checkpoint_path, state)
+
+    if state['fetched']:
+        done = True
+    else:
+        save_checkpoint(checkpoint_path, state)
+
+    query = {
+        '$orderby': dict(map(lambda x: (x, 'asc'), ORDER_KEYS[type_name]))
+    }
+
+    if year:
+        query['year'] = year
+
+    if partition is not None:
+        key_name = PARTITION_KEYS[type_name]
+        query[key_name] = {'$between': list(partition)}
+
+    if executor is None:
+        owned_executor = concurrent.futures.ThreadPoolExecutor(concurrency)
+        executor = owned_executor
+    else:
+        owned_executor = None
+
+    in_flight = collections.deque()
+    next_offset = offset
+    progress.start(label, offset)
+
+    def submit_next():
+        nonlocal next_offset
+        nonlocal resume_limit
+
+        if resume_limit is None:
+            limit = foss_client.get_page_size()
         else:
-            template_vals = (offset, status_code)
-            print('Offset of %d with status %d. Waiting...' % template_vals)
-            time.sleep(1)
+            limit = resume_limit
+            resume_limit = None
+
+        future = executor.submit(
+            foss_client.get_page,
+            endpoint,
+            next_offset,
+            limit,
+            query,
+            group_items
+        )
+        in_flight.append((limit, future))
+        next_offset += limit
+
+    try:
+        if not done:
+            for i in range(concurrency):
+                submit_next()
+
+        while not done:
+            page_limit, future = in_flight.popleft()
+            page = future.result()
+            write_response(page['items'])
+            offset += page_limit
+            done = page['count'] == 0
+            commit_page()
+            progress.record_page(label, offset, page['count'])
+
+            if not done:
+                submit_next()
+    finally:
+        for limit, future in in_flight:
+            future.cancel()
+
+        if owned_executor is not None:
+            owned_executor.shutdown()
+
+        journal.close()
+
+    if buffered:
+        template_vals = (label, len(segment_paths))
+        print('Flushing %s from %d spilled segments...' % template_vals)
+        flush_buffer()
+
+        if state['remove_staging']:
+            shutil.rmtree(staging_dir)
+
+    if manifest is not None:
+        manifest.update(state['manifest_updates'])
+
+    if type_name == 'species' and partition is None:
+        write_species_catalog(storage, loc)
+
+    if keep_checkpoint:
+        state['complete'] = True
+        save_checkpoint(checkpoint_path, state)
+    else:
+        os.remove(checkpoint_path)
+
+    os.remove(journal_path)
+    progress.finish(label)
+
+
+def parse_options(args):
+    flags = filter(lambda x: x.startswith('--'), args)
+    pairs = map(lambda x: x[2:].split('=', 1), flags)
+    return dict(map(lambda x: (x[0], x[1] if len(x) > 1 else ''), pairs))
+
+
+def get_dump_options(options):
+    return {
+        'buffered': 'buffered' in options or 'delta' in options,
+        'buffer_records': int(
+            options.get('buffer-records', DEFAULT_BUFFER_RECORDS)
+        ),
+        'resume': 'resume' in options
+    }
+
+
+def run_jobs(bucket, jobs, options):
+    workers = int(options.get('workers', DEFAULT_WORKERS))
+    num_jobs = int(options.get('jobs', DEFAULT_JOBS))
+    concurrency = int(options.get('concurrency', DEFAULT_CONCURRENCY))
+    staging_root = options.get('staging', None)
+    dump_options = get_dump_options(options)
+
+    foss_client = make_foss_client(options, workers)
+    storage = storage_lib.get_storage(bucket, workers)
+    progress = Progress()
+
+    if 'delta' in options:
+        locs = set(map(lambda x: x['loc'], jobs))
+        manifests = dict(map(
+            lambda x: (x, Manifest(storage, x)),
+            locs
+        ))
+    else:
+        manifests = {}
+
+    run_paths = []
+
+    def expand_job(job):
+        num_partitions = job.get('partitions', None)
+        if num_partitions is None:
+            return [dict(job, partition=None)]
+
+        partitions_path = get_default_partitions_path(
+            job['year'],
+            job['loc'],
+            job['type']
+        )
+        run_paths.append(partitions_path)
+
+        if dump_options['resume']:
+            partitions = load_partitions(partitions_path, num_partitions)
+        else:
+            partitions = None
+
+        if partitions is None:
+            partitions = get_partitions(
+                foss_client,
+                job['type'],
+                num_partitions
+            )
+            save_checkpoint(partitions_path, {
+                'num_partitions': num_partitions,
+                'partitions': list(map(list, partitions))
+            })
+
+        return [dict(job, partition=x) for x in partitions]
+
+    def get_job_checkpoint_path(job):
+        return get_default_checkpoint_path(
+            job['year'],
+            job['loc'],
+            job['type'],
+            job['partition']
+        )
+
+    def run_job(job, executor):
+        type_name = job['type']
+        year = job['year']
+        partition = job['partition']
+        checkpoint_path = get_job_checkpoint_path(job)
+
+        if staging_root is None:
+            staging_dir = None
+        else:
+            label = get_label(type_name, year, partition)
+            staging_dir = os.path.join(staging_root, label)
+
+        dump_to_s3(
+            year,
+            bucket,
+            job['loc'],
+            type_name,
+            concurrency=concurrency,
+            staging_dir=staging_dir,
+            checkpoint_path=checkpoint_path,
+            foss_client=foss_client,
+            storage=storage,
+            executor=executor,
+            progress=progress,
+            partition=partition,
+            manifest=manifests.get(job['loc'], None),
+            keep_checkpoint=True,
+            **dump_options
+        )
+
+    jobs_expanded = list(itertools.chain(*map(expand_job, jobs)))
+    run_paths.extend(map(get_job_checkpoint_path, jobs_expanded))
+
+    with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+        with concurrent.futures.ThreadPoolExecutor(num_jobs) as job_executor:
+            futures = list(map(
+                lambda x: job_executor.submit(run_job, x, executor),
+                jobs_expanded
+            ))
+            for future in concurrent.futures.as_completed(futures):
+                future.result()
+
+    if 'delta' in options:
+        changed_path = options.get('changed', DEFAULT_CHANGED_PATH)
+        write_changed(changed_path, manifests.values())
+
+        for manifest in manifests.values():
+            manifest.save()
+
+    for path in filter(os.path.exists, run_paths):
+        os.remove(path)
 
 
 def main():
-    if len(sys.argv) < MIN_ARGS + 1 or len(sys.argv) > MAX_ARGS + 1:
+    args = list(filter(lambda x: not x.startswith('--'), sys.argv))
+    options = parse_options(sys.argv[1:])
+
+    if len(args) < MIN_ARGS + 1 or len(args) > MAX_ARGS + 1:
         print(USAGE_STR)
         sys.exit(1)
 
-    type_name = sys.argv[1]
-    bucket = sys.argv[2]
-    loc = sys.argv[3]
+    type_name = args[1]
+    bucket = args[2]
+    loc = args[3]
 
-    if len(sys.argv) > 4:
-        year = int(sys.argv[4])
+    if len(args) > 4:
+        year = int(args[4])
     else:
         year = None
 
-    dump_to_s3(year, bucket, loc, type_name)
+    if 'partitions' in options:
+        job = {
+            'type': type_name,
+            'loc': loc,
+            'year': year,
+            'partitions': int(options['partitions'])
+        }
+        run_jobs(bucket, [job], options)
+        return
+
+    concurrency = int(options.get('concurrency', DEFAULT_CONCURRENCY))
+    staging_dir = options.get('staging', None)
+    checkpoint_path = options.get('checkpoint', None)
+
+    foss_client = make_foss_client(options, concurrency)
+    storage = storage_lib.get_storage(bucket, concurrency)
+
+    if 'delta' in options:
+        manifest = Manifest(storage, loc)
+    else:
+        manifest = None
+
+    dump_to_s3(
+        year,
+        bucket,
+        loc,
+        type_name,
+        concurrency=concurrency,
+        staging_dir=staging_dir,
+        checkpoint_path=checkpoint_path,
+        foss_client=foss_client,
+        storage=storage,
+        manifest=manifest,
+        **get_dump_options(options)
+    )
+
+    if manifest is not None:
+        changed_path = options.get('changed', DEFAULT_CHANGED_PATH)
+        write_changed(changed_path, [manifest])
+        manifest.save()
 
 
 if __name__ == '__main__':
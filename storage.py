@@ -0,0 +1,168 @@
+import concurrent.futures
+import io
+import mmap
+import os
+import threading
+
+import boto3
+import botocore.config
+import botocore.exceptions
+
+LOCAL_PREFIX = 'file://'
+MISSING_ERROR_CODES = {'404', 'NoSuchKey', 'NotFound'}
+DEFAULT_POOL_SIZE = 32
+
+storage_cache = {}
+storage_cache_lock = threading.Lock()
+
+
+class MissingObjectError(Exception):
+    pass
+
+
+def is_missing_error(error):
+    error_code = error.response.get('Error', {}).get('Code', None)
+    return error_code in MISSING_ERROR_CODES
+
+
+class S3Storage:
+
+    def __init__(self, bucket, pool_size=DEFAULT_POOL_SIZE):
+        self._bucket = bucket
+        self._client = boto3.client(
+            's3',
+            aws_access_key_id=os.environ.get('AWS_ACCESS_KEY', None),
+            aws_secret_access_key=os.environ.get('AWS_ACCESS_SECRET', None),
+            config=botocore.config.Config(max_pool_connections=pool_size)
+        )
+
+    def get(self, loc):
+        target_buffer = io.BytesIO()
+
+        try:
+            self._client.download_fileobj(self._bucket, loc, target_buffer)
+        except botocore.exceptions.ClientError as e:
+            if is_missing_error(e):
+                raise MissingObjectError(loc) from e
+            raise
+
+        target_buffer.seek(0)
+        return target_buffer
+
+    def get_range(self, loc, start, end):
+        try:
+            response = self._client.get_object(
+                Bucket=self._bucket,
+                Key=loc,
+                Range='bytes=%d-%d' % (start, end - 1)
+            )
+        except botocore.exceptions.ClientError as e:
+            if is_missing_error(e):
+                raise MissingObjectError(loc) from e
+            raise
+
+        return io.BytesIO(response['Body'].read())
+
+    def put(self, loc, source_buffer):
+        self._client.upload_fileobj(source_buffer, self._bucket, loc)
+
+    def list(self, prefix):
+        return map(lambda x: x['Key'], self._list_items(prefix))
+
+    def list_versions(self, prefix):
+        return map(lambda x: (x['Key'], x['ETag']), self._list_items(prefix))
+
+    def _list_items(self, prefix):
+        paginator = self._client.get_paginator('list_objects_v2')
+        iterator = paginator.paginate(Bucket=self._bucket, Prefix=prefix)
+        pages = filter(lambda x: 'Contents' in x, iterator)
+        for page in pages:
+            yield from page['Contents']
+
+
+class LocalStorage:
+
+    def __init__(self, root):
+        self._root = root
+
+    def get(self, loc):
+        full_path = self._get_path(loc)
+
+        try:
+            with open(full_path, 'rb') as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    return io.BytesIO()
+
+                return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except FileNotFoundError as e:
+            raise MissingObjectError(loc) from e
+
+    def get_range(self, loc, start, end):
+        full_path = self._get_path(loc)
+
+        try:
+            with open(full_path, 'rb') as f:
+                f.seek(start)
+                return io.BytesIO(f.read(end - start))
+        except FileNotFoundError as e:
+            raise MissingObjectError(loc) from e
+
+    def put(self, loc, source_buffer):
+        full_path = self._get_path(loc)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+
+        temp_path = full_path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(source_buffer.read())
+
+        os.replace(temp_path, full_path)
+
+    def list(self, prefix):
+        return map(lambda x: x[0], self._list_paths(prefix))
+
+    def list_versions(self, prefix):
+
+        def get_version(full_path):
+            stat = os.stat(full_path)
+            return '%d-%d' % (stat.st_mtime_ns, stat.st_size)
+
+        return map(
+            lambda x: (x[0], get_version(x[1])),
+            self._list_paths(prefix)
+        )
+
+    def _list_paths(self, prefix):
+        prefix_dir = os.path.dirname(prefix)
+        walk_root = self._get_path(prefix_dir)
+
+        for dir_path, dir_names, file_names in os.walk(walk_root):
+            dir_names.sort()
+            for file_name in sorted(file_names):
+                if file_name.endswith('.tmp'):
+                    continue
+
+                full_path = os.path.join(dir_path, file_name)
+                loc = os.path.relpath(full_path, self._root)
+                loc = loc.replace(os.sep, '/')
+                if loc.startswith(prefix):
+                    yield (loc, full_path)
+
+    def _get_path(self, loc):
+        return os.path.join(self._root, *loc.split('/'))
+
+
+def get_storage(bucket, pool_size=DEFAULT_POOL_SIZE):
+    with storage_cache_lock:
+        if bucket not in storage_cache:
+            if bucket.startswith(LOCAL_PREFIX):
+                root = bucket[len(LOCAL_PREFIX):]
+                storage_cache[bucket] = LocalStorage(root)
+            else:
+                storage_cache[bucket] = S3Storage(bucket, pool_size)
+
+        return storage_cache[bucket]
+
+
+def get_all(storage, locs, workers=DEFAULT_POOL_SIZE):
+    with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+        yield from executor.map(storage.get, locs)
@@ -0,0 +1,99 @@
+import http.server
+import json
+import threading
+import time
+import urllib.parse
+
+
+class FossStub:
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.faults = []
+        self.requests = []
+        self._server = None
+
+    def start(self):
+        stub = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                parsed = urllib.parse.urlparse(self.path)
+                query = urllib.parse.parse_qs(parsed.query)
+                offset = int(query['offset'][0])
+                limit = int(query['limit'][0])
+                stub.requests.append((offset, limit))
+
+                if len(stub.faults) > 0:
+                    fault = stub.faults.pop(0)
+                else:
+                    fault = {}
+
+                stub.respond(self, fault, offset, limit)
+
+        self._server = http.server.ThreadingHTTPServer(
+            ('127.0.0.1', 0),
+            Handler
+        )
+        thread = threading.Thread(target=self._server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return 'http://127.0.0.1:%d' % self._server.server_address[1]
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def respond(self, handler, fault, offset, limit):
+        if 'status' in fault:
+            handler.send_response(fault['status'])
+            if 'retry_after' in fault:
+                handler.send_header('Retry-After', fault['retry_after'])
+            handler.send_header('Content-Length', '0')
+            handler.end_headers()
+            return
+
+        if 'delay' in fault:
+            time.sleep(fault['delay'])
+
+        items = self.rows[offset:offset + limit]
+        has_more = offset + limit < len(self.rows)
+
+        if fault.get('short', False):
+            items = items[:-1]
+            has_more = True
+
+        body = json.dumps({'items': items, 'hasMore': has_more})
+        body_bytes = body.encode('utf-8')
+
+        if fault.get('truncated', False):
+            body_bytes = body_bytes[:len(body_bytes) // 2]
+            handler.send_response(200)
+            handler.send_header('Connection', 'close')
+            handler.end_headers()
+            handler.wfile.write(body_bytes)
+            return
+
+        handler.send_response(200)
+        handler.send_header('Content-Length', str(len(body_bytes)))
+        handler.end_headers()
+        handler.wfile.write(body_bytes)
+
+
+def make_catch_rows(num_rows, num_hauls):
+    return list(map(
+        lambda x: {
+            'hauljoin': 1000 + x % num_hauls,
+            'species_code': x,
+            'cpue_kgkm2': 1.0,
+            'cpue_nokm2': None,
+            'count': 1,
+            'weight_kg': 2.0,
+            'taxon_confidence': None
+        },
+        range(num_rows)
+    ))
@@ -0,0 +1,159 @@
+import unittest
+import unittest.mock
+
+import foss_client as foss_client_lib
+from tests import foss_stub
+
+ENDPOINT = '/ods/foss/afsc_groundfish_survey_catch/'
+
+
+class FossClientTests(unittest.TestCase):
+
+    def setUp(self):
+        self._stub = foss_stub.FossStub(foss_stub.make_catch_rows(50, 3))
+        self._domain = self._stub.start()
+        self._sizer = foss_client_lib.PageSizer(
+            initial_size=2000,
+            min_size=500,
+            max_size=4000,
+            target_latency=0.1
+        )
+        self._client = foss_client_lib.FossClient(
+            domain=self._domain,
+            page_sizer=self._sizer,
+            max_retries=2,
+            base_delay=0.5,
+            max_delay=60
+        )
+        sleep_patch = unittest.mock.patch('foss_client.time.sleep')
+        self._sleep = sleep_patch.start()
+        self.addCleanup(sleep_patch.stop)
+
+    def tearDown(self):
+        self._stub.stop()
+
+    def get_delays(self):
+        return list(map(lambda x: x[0][0], self._sleep.call_args_list))
+
+    def test_page(self):
+        page = self._client.get_page(ENDPOINT, 0, 10)
+        self.assertEqual(page['count'], 10)
+        self.assertTrue(page['hasMore'])
+        self.assertEqual(page['items'][0]['species_code'], 0)
+        self.assertEqual(self._stub.requests, [(0, 10)])
+
+    def test_retry_after(self):
+        self._stub.faults = [
+            {'status': 429, 'retry_after': '7'},
+            {'status': 503, 'retry_after': '120'}
+        ]
+        page = self._client.get_page(ENDPOINT, 10, 10)
+        self.assertEqual(page['count'], 10)
+        self.assertEqual(self.get_delays(), [7, 60])
+        self.assertEqual(len(self._stub.requests), 3)
+
+    def test_backoff_without_retry_after(self):
+        self._stub.faults = [{'status': 503}, {'status': 503}]
+        self._client.get_page(ENDPOINT, 0, 10)
+        delays = self.get_delays()
+        self.assertEqual(len(delays), 2)
+        self.assertTrue(0 <= delays[0] <= 0.5)
+        self.assertTrue(0 <= delays[1] <= 1)
+
+    def test_retry_limit(self):
+        self._stub.faults = list(map(lambda x: {'status': 503}, range(5)))
+        with self.assertRaises(foss_client_lib.FossRequestError):
+            self._client.get_page(ENDPOINT, 0, 10)
+
+        self.assertEqual(len(self._stub.requests), 3)
+        self.assertEqual(len(self.get_delays()), 2)
+
+    def test_not_retryable(self):
+        self._stub.faults = [{'status': 404}]
+        with self.assertRaises(foss_client_lib.FossRequestError):
+            self._client.get_page(ENDPOINT, 0, 10)
+
+        self.assertEqual(len(self._stub.requests), 1)
+        self.assertEqual(self.get_delays(), [])
+
+    def test_truncated(self):
+        self._stub.faults = [{'truncated': True}]
+        page = self._client.get_page(ENDPOINT, 0, 10)
+        self.assertEqual(page['count'], 10)
+        self.assertEqual(len(self._stub.requests), 2)
+        self.assertEqual(len(self.get_delays()), 1)
+
+    def test_short_page(self):
+        self._stub.faults = [{'short': True}]
+        with self.assertRaises(foss_client_lib.FossRequestError):
+            self._client.get_page(ENDPOINT, 0, 10)
+
+        self.assertEqual(len(self._stub.requests), 1)
+
+    def test_consume(self):
+        page = self._client.get_page(
+            ENDPOINT,
+            0,
+            6,
+            consume=lambda x: sum(map(lambda y: 1, x))
+        )
+        self.assertEqual(page['items'], 6)
+        self.assertEqual(page['count'], 6)
+
+
+class PageSizerTests(unittest.TestCase):
+
+    def setUp(self):
+        self._stub = foss_stub.FossStub(foss_stub.make_catch_rows(50, 3))
+        self._domain = self._stub.start()
+        self.use_sizer(0.1)
+
+    def tearDown(self):
+        self._stub.stop()
+
+    def use_sizer(self, target_latency):
+        self._sizer = foss_client_lib.PageSizer(
+            initial_size=2000,
+            min_size=500,
+            max_size=4000,
+            target_latency=target_latency
+        )
+        self._client = foss_client_lib.FossClient(
+            domain=self._domain,
+            page_sizer=self._sizer,
+            max_retries=2,
+            base_delay=0
+        )
+
+    def test_grow_on_fast(self):
+        self.use_sizer(60)
+        self._client.get_page(ENDPOINT, 0, 10)
+        self.assertEqual(self._sizer.get_size(), 3000)
+        self._client.get_page(ENDPOINT, 0, 10)
+        self._client.get_page(ENDPOINT, 0, 10)
+        self.assertEqual(self._sizer.get_size(), 4000)
+
+    def test_shrink_on_slow(self):
+        self._stub.faults = [{'delay': 0.3}]
+        self._client.get_page(ENDPOINT, 0, 10)
+        self.assertEqual(self._sizer.get_size(), 1500)
+
+    def test_halve_on_failure(self):
+        self._stub.faults = [{'status': 503}, {'status': 503}]
+        with unittest.mock.patch('foss_client.time.sleep'):
+            self._client.get_page(ENDPOINT, 0, 10)
+
+        self.assertEqual(self._sizer.get_size(), 1500)
+
+    def test_min_size(self):
+        sizer = foss_client_lib.PageSizer(
+            initial_size=600,
+            min_size=500,
+            max_size=4000
+        )
+        sizer.record_failure()
+        self.assertEqual(sizer.get_size(), 500)
+
+
+if __name__ == '__main__':
+    unittest.main()
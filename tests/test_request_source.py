@@ -0,0 +1,235 @@
+import os
+import shutil
+import tempfile
+import unittest
+import unittest.mock
+
+import fastavro
+
+import foss_client as foss_client_lib
+import request_source
+import storage as storage_lib
+from tests import foss_stub
+
+
+class FailingStorage(storage_lib.LocalStorage):
+
+    def __init__(self, root, fail_loc):
+        super().__init__(root)
+        self._fail_loc = fail_loc
+
+    def put(self, loc, source_buffer):
+        if loc == self._fail_loc:
+            raise RuntimeError('Failed to write %s.' % loc)
+
+        super().put(loc, source_buffer)
+
+
+class ResumeTests(unittest.TestCase):
+
+    def setUp(self):
+        self._rows = foss_stub.make_catch_rows(21, 3)
+        self._stub = foss_stub.FossStub(self._rows)
+        self._domain = self._stub.start()
+        self._root = tempfile.mkdtemp()
+        self._checkpoint_path = os.path.join(self._root, 'catch.json')
+
+    def tearDown(self):
+        self._stub.stop()
+        shutil.rmtree(self._root)
+
+    def make_client(self, page_size):
+        sizer = foss_client_lib.PageSizer(
+            initial_size=page_size,
+            min_size=page_size,
+            max_size=page_size
+        )
+        return foss_client_lib.FossClient(
+            domain=self._domain,
+            page_sizer=sizer,
+            max_retries=0
+        )
+
+    def dump(self, page_size, storage, resume):
+        request_source.dump_to_s3(
+            2021,
+            'file://' + self._root,
+            'catch',
+            'catch',
+            checkpoint_path=self._checkpoint_path,
+            resume=resume,
+            foss_client=self.make_client(page_size),
+            storage=storage
+        )
+
+    def read_catch(self, hauljoin):
+        storage = storage_lib.LocalStorage(self._root)
+        loc = 'catch/%d.avro' % hauljoin
+        return list(fastavro.reader(storage.get(loc)))
+
+    def test_resume_larger_page(self):
+        failing = FailingStorage(self._root, 'catch/1001.avro')
+        with self.assertRaises(RuntimeError):
+            self.dump(5, failing, False)
+
+        self.assertEqual(len(self.read_catch(1000)), 2)
+
+        self.dump(100, storage_lib.LocalStorage(self._root), True)
+
+        for hauljoin in [1000, 1001, 1002]:
+            expected = list(filter(
+                lambda x: x['hauljoin'] == hauljoin,
+                self._rows
+            ))
+            actual = self.read_catch(hauljoin)
+            self.assertEqual(
+                sorted(map(lambda x: x['species_code'], actual)),
+                sorted(map(lambda x: x['species_code'], expected))
+            )
+
+        self.assertEqual(self._stub.requests[1], (0, 5))
+        self.assertFalse(os.path.exists(self._checkpoint_path))
+        journal_path = request_source.get_journal_path(self._checkpoint_path)
+        self.assertFalse(os.path.exists(journal_path))
+
+    def test_resume_journal_per_page(self):
+        failing = FailingStorage(self._root, 'catch/1002.avro')
+        with self.assertRaises(RuntimeError):
+            self.dump(5, failing, False)
+
+        journal_path = request_source.get_journal_path(self._checkpoint_path)
+        entries = request_source.load_journal(journal_path, 0)
+        self.assertEqual(
+            list(map(lambda x: x['loc'], entries)),
+            ['catch/1000.avro', 'catch/1001.avro']
+        )
+        self.assertEqual(set(map(lambda x: x['limit'], entries)), {5})
+
+        with open(self._checkpoint_path) as f:
+            checkpoint = f.read()
+
+        self.assertNotIn('catch/1000.avro', checkpoint)
+
+
+class DeltaTests(unittest.TestCase):
+
+    def setUp(self):
+        self._rows = foss_stub.make_catch_rows(21, 3)
+        self._stub = foss_stub.FossStub(self._rows)
+        self._domain = self._stub.start()
+        self._root = tempfile.mkdtemp()
+        self._checkpoint_path = os.path.join(self._root, 'catch.json')
+
+    def tearDown(self):
+        self._stub.stop()
+        shutil.rmtree(self._root)
+
+    def dump(self):
+        storage = storage_lib.LocalStorage(self._root)
+        manifest = request_source.Manifest(storage, 'catch')
+        request_source.dump_to_s3(
+            2021,
+            'file://' + self._root,
+            'catch',
+            'catch',
+            buffered=True,
+            checkpoint_path=self._checkpoint_path,
+            foss_client=foss_client_lib.FossClient(domain=self._domain),
+            storage=storage,
+            manifest=manifest
+        )
+        manifest.save()
+        return manifest.get_changed()
+
+    def test_reordered_source_unchanged(self):
+        self.assertEqual(len(self.dump()), 3)
+
+        self._stub.rows = list(reversed(self._rows))
+        self.assertEqual(self.dump(), [])
+
+
+class RunJobsTests(unittest.TestCase):
+
+    def setUp(self):
+        self._rows = foss_stub.make_catch_rows(21, 3)
+        self._stub = foss_stub.FossStub(self._rows)
+        self._domain = self._stub.start()
+        self._root = tempfile.mkdtemp()
+        self._bucket = 'file://' + self._root
+        self._cwd = os.getcwd()
+        work_dir = os.path.join(self._root, 'work')
+        os.mkdir(work_dir)
+        os.chdir(work_dir)
+
+    def tearDown(self):
+        os.chdir(self._cwd)
+        storage_lib.storage_cache.pop(self._bucket, None)
+        self._stub.stop()
+        shutil.rmtree(self._root)
+
+    def run_jobs(self, jobs, storage, resume):
+        storage_lib.storage_cache[self._bucket] = storage
+        options = {
+            'domain': self._domain,
+            'workers': '2',
+            'jobs': '1',
+            'max-page-size': '5',
+            'max-retries': '0'
+        }
+        if resume:
+            options['resume'] = ''
+
+        request_source.run_jobs(self._bucket, jobs, options)
+
+    def count_rows(self, loc):
+        storage = storage_lib.LocalStorage(self._root)
+        locs = storage.list(loc + '/')
+        readers = map(lambda x: fastavro.reader(storage.get(x)), locs)
+        return sum(map(lambda x: len(list(x)), readers))
+
+    def test_resume_skips_complete_jobs(self):
+        jobs = [
+            {'type': 'catch', 'loc': 'catch', 'year': None},
+            {'type': 'catch', 'loc': 'catch_b', 'year': None}
+        ]
+        failing = FailingStorage(self._root, 'catch_b/1001.avro')
+        with self.assertRaises(RuntimeError):
+            self.run_jobs(jobs, failing, False)
+
+        self.run_jobs(jobs, storage_lib.LocalStorage(self._root), True)
+
+        self.assertEqual(self.count_rows('catch'), 21)
+        self.assertEqual(self.count_rows('catch_b'), 21)
+        self.assertEqual(os.listdir('.'), [])
+
+    def test_resume_reuses_partitions(self):
+        jobs = [{
+            'type': 'catch',
+            'loc': 'catch',
+            'year': None,
+            'partitions': 1
+        }]
+        failing = FailingStorage(self._root, 'catch/1001.avro')
+        partitions_first = [(1000, 1002)]
+        with unittest.mock.patch.object(
+            request_source,
+            'get_partitions',
+            return_value=partitions_first
+        ):
+            with self.assertRaises(RuntimeError):
+                self.run_jobs(jobs, failing, False)
+
+        partitions_moved = [(999, 1002)]
+        with unittest.mock.patch.object(
+            request_source,
+            'get_partitions',
+            return_value=partitions_moved
+        ):
+            self.run_jobs(jobs, storage_lib.LocalStorage(self._root), True)
+
+        self.assertEqual(self.count_rows('catch'), 21)
+        self.assertEqual(os.listdir('.'), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
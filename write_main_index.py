@@ -1,12 +1,13 @@
 import io
 import itertools
-import os
 import sys
 
-import boto3
-import fastavro
 import toolz.itertoolz
 
+import joined
+import records as records_lib
+import storage as storage_lib
+
 KEY_SCHEMA = {
     'doc': 'Key to an observation flat file.',
     'name': 'Key',
@@ -20,24 +21,45 @@ KEY_SCHEMA = {
 }
 
 NUM_ARGS = 1
-USAGE_STR = 'python write_main_index.py [bucket]'
+USAGE_STR = 'python write_main_index.py [bucket] [--packed]'
+
+
+def get_packed_records(storage):
+
+    def read_entries(path):
+        filename_with_path = path.split('/')[-1]
+        filename = filename_with_path.split('.')[0]
+        components = filename.split('_')
+        year = int(components[0])
+        survey = components[1]
+        packed_index = joined.read_packed_index(storage, year, survey)
+        return packed_index['entries']
+
+    keys = storage.list(joined.PACKED_PREFIX)
+    keys_index = filter(joined.is_packed_index_loc, keys)
+    entries_nest = map(read_entries, keys_index)
+    entries = itertools.chain(*entries_nest)
+    return map(
+        lambda x: {
+            'year': x['year'],
+            'survey': x['survey'],
+            'haul': x['haul']
+        },
+        entries
+    )
 
 
 def main():
-    if len(sys.argv) != NUM_ARGS + 1:
+    args = list(filter(lambda x: not x.startswith('--'), sys.argv))
+    packed = '--packed' in sys.argv
+
+    if len(args) != NUM_ARGS + 1:
         print(USAGE_STR)
         sys.exit(1)
 
-    bucket = sys.argv[1]
+    bucket = args[1]
 
-    access_key = os.environ['AWS_ACCESS_KEY']
-    access_secret = os.environ['AWS_ACCESS_SECRET']
-
-    s3_client = boto3.client(
-        's3',
-        aws_access_key_id=access_key,
-        aws_secret_access_key=access_secret
-    )
+    storage = storage_lib.get_storage(bucket)
 
     def make_haul_metadata_record(path):
         filename_with_path = path.split('/')[-1]
@@ -49,29 +71,21 @@ def main():
             'haul': int(components[2])
         }
 
-    paginator = s3_client.get_paginator('list_objects_v2')
-    iterator = paginator.paginate(Bucket=bucket, Prefix='joined/')
-    pages = filter(lambda x: 'Contents' in x, iterator)
-    contents = map(lambda x: x['Contents'], pages)
-    contents_flat = itertools.chain(*contents)
-    keys = map(lambda x: x['Key'], contents_flat)
-    metadata_records = map(make_haul_metadata_record, keys)
+    if packed:
+        metadata_records = get_packed_records(storage)
+    else:
+        keys = storage.list('joined/')
+        metadata_records = map(make_haul_metadata_record, keys)
 
     write_buffer = io.BytesIO()
-    fastavro.writer(
+    records_lib.compile_schema(KEY_SCHEMA).write(
         write_buffer,
-        KEY_SCHEMA,
         metadata_records
     )
     write_buffer.seek(0)
 
-    s3_client = boto3.client(
-        's3',
-        aws_access_key_id=access_key,
-        aws_secret_access_key=access_secret
-    )
     output_loc = 'index/main.avro'
-    s3_client.upload_fileobj(write_buffer, bucket, output_loc)
+    storage.put(output_loc, write_buffer)
 
 
 if __name__ == '__main__':